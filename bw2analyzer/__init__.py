@@ -2,9 +2,11 @@ __all__ = [
     "compare_activities_by_grouped_leaves",
     "compare_activities_by_lcia_score",
     "ContributionAnalysis",
+    "ContributionStability",
     "DatabaseHealthCheck",
     "find_differences_in_inputs",
     "GTManipulator",
+    "iter_recursive_calculation",
     "PageRank",
     "print_recursive_calculation",
     "print_recursive_supply_chain",
@@ -23,6 +25,11 @@ from .page_rank import PageRank
 
 # from .report import SerializedLCAReport
 from .sc_graph import GTManipulator
+from .stability import ContributionStability
 from .tagged import traverse_tagged_databases
-from .utils import print_recursive_calculation, print_recursive_supply_chain
+from .utils import (
+    iter_recursive_calculation,
+    print_recursive_calculation,
+    print_recursive_supply_chain,
+)
 from .version import version as __version__
@@ -1,13 +1,244 @@
+import weakref
+from functools import cached_property
+
 import numpy as np
+import pandas as pd
+from scipy import sparse
 from bw2data import get_activity
 
+from .metadata import resolver
+
+
+def top_indices(values, limit):
+    """Return indices of the ``limit`` largest elements along the last axis of ``values``, largest first.
+
+    Uses a partial selection (``np.argpartition``) and only sorts the selected elements. Ties are returned in index order.
+    """
+    length = values.shape[-1]
+    limit = max(min(limit, length), 0)
+    if limit == 0:
+        return np.zeros(values.shape[:-1] + (0,), dtype=int)
+    elif limit < length:
+        selected = np.argpartition(-values, limit - 1, axis=-1)[..., :limit]
+    else:
+        selected = np.broadcast_to(np.arange(length), values.shape)
+    order = np.lexsort(
+        (selected, -np.take_along_axis(values, selected, axis=-1)), axis=-1
+    )
+    return np.take_along_axis(selected, order, axis=-1)
+
+
+def cumulative_indices(values, share, total):
+    """Return indices of the largest elements along the last axis of ``values`` (which must be non-negative) that together sum to at least ``share * total``, largest first.
+
+    Returns ``(indices, counts)``; only the first ``counts`` indices (per row for 2-d ``values``) are needed to reach the target. Zeros are never counted.
+
+    Starts with a partial selection of 64 elements, and only selects more if these don't reach the target, so usually needs one partial sort and one cumulative sum.
+    """
+    length = values.shape[-1]
+    target = np.reshape(
+        share * np.asarray(total, dtype=float), values.shape[:-1] + (1,)
+    )
+    limit = min(64, length)
+    while True:
+        indices = top_indices(values, limit)
+        selected = np.take_along_axis(values, indices, axis=-1)
+        cumulative = np.cumsum(selected, axis=-1)
+        if limit == length or (cumulative[..., -1:] >= target).all():
+            break
+        limit = min(limit * 4, length)
+    counts = np.minimum(
+        (cumulative < target).sum(axis=-1) + 1, (selected > 0).sum(axis=-1)
+    )
+    return indices, counts
+
+
+class MarginalSums:
+    """Row and column sums of a matrix. Each sum is computed on first access and then reused."""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    @cached_property
+    def row_sums(self):
+        return np.array(self.matrix.sum(axis=1)).ravel()
+
+    @cached_property
+    def col_sums(self):
+        return np.array(self.matrix.sum(axis=0)).ravel()
+
+    @cached_property
+    def sparse_row_sums(self):
+        """Row sums of a sparse matrix as a sparse ``(1, rows)`` vector. Only rows with stored values are included, so memory use scales with the number of non-zeros."""
+        coo = self.matrix.tocoo()
+        return self._sparse_sums(coo.row, coo.data, self.matrix.shape[0])
+
+    @cached_property
+    def sparse_col_sums(self):
+        """Column sums of a sparse matrix as a sparse ``(1, cols)`` vector."""
+        coo = self.matrix.tocoo()
+        return self._sparse_sums(coo.col, coo.data, self.matrix.shape[1])
+
+    @staticmethod
+    def _sparse_sums(indices, data, length):
+        unique, inverse = np.unique(indices, return_inverse=True)
+        return sparse.csr_matrix(
+            (
+                np.bincount(inverse, weights=data, minlength=unique.shape[0]),
+                unique,
+                np.array([0, unique.shape[0]]),
+            ),
+            shape=(1, length),
+        )
+
+    @cached_property
+    def abs_col_sums(self):
+        return np.array(abs(self.matrix).sum(axis=0)).ravel()
+
+    @cached_property
+    def abs_total(self):
+        return self.abs_col_sums.sum()
+
+
+class ResultContext:
+    """Cached ``MarginalSums`` of the result matrices of one LCA object.
+
+    The LCA object is only referenced weakly. Sums are thrown away as soon as ``lci``, ``lcia``, ``redo_lcia``, etc. replace the underlying matrix.
+    """
+
+    matrices = ("characterized_inventory", "inventory")
+
+    def __init__(self, lca):
+        self._lca = weakref.ref(lca)
+        self._sums = {}
+        self._ids = {}
+        self.indicators = {}
+
+    def sums(self, attribute):
+        matrix = getattr(self._lca(), attribute)
+        cached = self._sums.get(attribute)
+        if cached is None or cached.matrix is not matrix:
+            cached = self._sums[attribute] = MarginalSums(matrix)
+        return cached
+
+    @property
+    def characterized(self):
+        return self.sums("characterized_inventory")
+
+    @property
+    def inventory(self):
+        return self.sums("inventory")
+
+    def ids(self, label):
+        """Array of node ids for each matrix index of ``lca.dicts.<label>``, e.g. ``ids("activity")``."""
+        if label not in self._ids:
+            mapping = getattr(self._lca().dicts, label)
+            ids = np.zeros(len(mapping), dtype=np.int64)
+            ids[np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping))] = (
+                np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+            )
+            self._ids[label] = ids
+        return self._ids[label]
+
+    def find(self, matrix):
+        """Return the ``MarginalSums`` for ``matrix`` if it is one of this LCA's current result matrices, otherwise ``None``."""
+        lca = self._lca()
+        for attribute in self.matrices:
+            if getattr(lca, attribute, None) is matrix:
+                return self.sums(attribute)
+
+
+def object_array(values):
+    """Create a 1-d numpy object array, even if the values are tuples."""
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class ContributionResults:
+    """Columnar contribution results, as returned by ``annotated_top_processes`` and ``annotated_top_emissions`` with ``columnar=True``.
+
+    ``score``, ``amount`` (supply or inventory amount), ``index`` (matrix index) and ``ids`` (node ids) are numpy arrays. Node metadata is only fetched when first accessed, and then for all rows in bulk: use ``metadata(field)``, or the ``name``, ``location``, ``unit`` and ``keys`` properties.
+    """
+
+    def __init__(self, score, amount, index, ids):
+        self.score = score
+        self.amount = amount
+        self.index = index
+        self.ids = ids
+        self._nodes = None
+
+    def __len__(self):
+        return self.score.shape[0]
+
+    def metadata(self, field, default=None):
+        """Return an object array of ``field`` values for all rows."""
+        if self._nodes is None:
+            self._nodes = resolver.get_many(self.ids.tolist())
+        return object_array([data.get(field, default) for data in self._nodes])
+
+    @property
+    def name(self):
+        return self.metadata("name", "Unknown")
+
+    @property
+    def location(self):
+        return self.metadata("location")
+
+    @property
+    def unit(self):
+        return self.metadata("unit")
+
+    @property
+    def keys(self):
+        return object_array(
+            list(
+                zip(self.metadata("database").tolist(), self.metadata("code").tolist())
+            )
+        )
+
+    def as_dataframe(self, fields=("name", "location", "unit")):
+        """Return a pandas ``DataFrame``, with one column for each metadata field in ``fields``."""
+        df = pd.DataFrame(
+            {
+                "score": self.score,
+                "amount": self.amount,
+                "index": self.index,
+                "id": self.ids,
+            }
+        )
+        for field in fields:
+            df[field] = self.metadata(field)
+        return df
+
 
 class ContributionAnalysis:
+    # Shared by all instances, so that ``ContributionAnalysis().foo(lca)`` calls reuse sums
+    _contexts = weakref.WeakKeyDictionary()
+
+    def result_context(self, lca):
+        """Get the ``ResultContext`` of ``lca``, creating it if needed."""
+        try:
+            return self._contexts[lca]
+        except KeyError:
+            context = self._contexts[lca] = ResultContext(lca)
+            return context
+
+    def marginal_sums(self, matrix):
+        """Get ``MarginalSums`` for ``matrix``. These are cached if ``matrix`` is a current result matrix of an LCA with a result context."""
+        for context in list(self._contexts.values()):
+            sums = context.find(matrix)
+            if sums is not None:
+                return sums
+        return MarginalSums(matrix)
+
     def sort_array(self, data, limit=25, limit_type="number", total=None):
         """
         Common sorting function for all ``top`` methods. Sorts by highest value first.
 
-        Operates in either ``number`` or ``percent`` mode. In ``number`` mode, return ``limit`` values. In ``percent`` mode, return all values >= (total * limit); where ``0 < limit <= 1``.
+        Operates in either ``number``, ``percent`` or ``cumulative`` mode. In ``number`` mode, return ``limit`` values. In ``percent`` mode, return all values >= (total * limit); where ``0 < limit <= 1``. In ``cumulative`` mode, return the smallest set of values which together make up at least (total * limit) (in absolute terms); where ``0 < limit <= 1``.
+
+        Only the selected values are sorted; the rest of ``data`` is skipped with a partial selection (``np.argpartition``), so finding the top 25 of 20.000 values is cheap.
 
         Returns 2-d numpy array of sorted values and row indices, e.g.:
 
@@ -25,30 +256,118 @@ class ContributionAnalysis:
                 (1, 0)
             )
 
+        ``data`` can also be a 2-d array, in which case each row is sorted separately and a 3-d array of shape ``(rows, limit, 2)`` is returned. In ``percent`` and ``cumulative`` mode, ``total`` can then be given per row, and rows with fewer values than the longest row are padded with ``np.nan``.
+
+        ``data`` can also be a scipy sparse matrix. Sparse vectors (one row or column) are sorted like 1-d arrays, other sparse matrices row by row. Only the stored non-zero values are ranked; zeros are implicit and never returned (rows of sparse matrices are padded with ``np.nan`` instead). Memory use scales with the number of non-zeros, not with the length of the vector.
+
         Args:
-            * *data* (numpy array): A 1-d array of values to sort.
+            * *data* (numpy array): A 1-d or 2-d array of values to sort.
             * *limit* (number, default=25): Number of values to return, or percentage cutoff.
-            * *limit_type* (str, default=``number``): Either ``number`` or ``percent``.
+            * *limit_type* (str, default=``number``): One of ``number``, ``percent``, or ``cumulative``.
             * *total* (number, default=None): Optional specification of summed data total.
 
         Returns:
-            2-d numpy array of values and row indices.
+            2-d numpy array of values and row indices (3-d if ``data`` is 2-d).
 
         """
-        total = total or np.abs(data).sum()
-        if limit_type not in ("number", "percent"):
-            raise ValueError("limit_type must be either 'percent' or 'index'.")
-        if limit_type == "percent":
-            if not 0 < limit <= 1:
-                raise ValueError("Percentage limits > 0 and <= 1.")
-            limit = (np.abs(data) >= (total * limit)).sum()
-
-        results = np.hstack(
-            (data.reshape((-1, 1)), np.arange(data.shape[0]).reshape((-1, 1)))
-        )
-        return results[np.argsort(np.abs(data))[::-1]][:limit, :]
+        if limit_type not in ("number", "percent", "cumulative"):
+            raise ValueError(
+                "limit_type must be one of 'number', 'percent', or 'cumulative'."
+            )
+        if limit_type in ("percent", "cumulative") and not 0 < limit <= 1:
+            raise ValueError("Percentage limits > 0 and <= 1.")
+        if sparse.issparse(data):
+            return self._sort_sparse(data, limit, limit_type, total)
+        data = np.asarray(data)
+        if data.ndim == 2:
+            return self._sort_rows(data, limit, limit_type, total)
+
+        abs_data = np.abs(data)
+        total = total or abs_data.sum()
+        if limit_type == "cumulative":
+            indices, count = cumulative_indices(abs_data, limit, total)
+            indices = indices[:count]
+        else:
+            if limit_type == "percent":
+                limit = (abs_data >= (total * limit)).sum()
+            indices = top_indices(abs_data, int(limit))
+        return np.column_stack((data[indices], indices))
+
+    def _sort_sparse(self, data, limit, limit_type, total):
+        """``sort_array`` for the stored non-zero values of a sparse vector or matrix."""
+        if 1 in data.shape:
+            coo = data.tocoo(copy=True)
+            coo.sum_duplicates()
+            coo.eliminate_zeros()
+            indices = coo.col if data.shape[0] == 1 else coo.row
+            results = self.sort_array(
+                coo.data, limit=limit, limit_type=limit_type, total=total
+            )
+            results[:, 1] = indices[results[:, 1].astype(int)]
+            return results
+
+        # Sort all non-zeros by row, then by descending absolute value, and keep a prefix of each row
+        csr = data.tocsr(copy=True)
+        csr.sum_duplicates()
+        csr.eliminate_zeros()
+        rows = csr.shape[0]
+        counts = np.diff(csr.indptr)
+        row_ids = np.repeat(np.arange(rows), counts)
+        abs_data = np.abs(csr.data)
+        order = np.lexsort((csr.indices, -abs_data, row_ids))
+        sorted_abs = abs_data[order]
+        positions = np.arange(csr.nnz) - csr.indptr[row_ids]
+
+        if total is None and limit_type != "number":
+            total = np.bincount(row_ids, weights=abs_data, minlength=rows)
+        if limit_type == "number":
+            keep = np.minimum(counts, int(limit))
+        else:
+            total = np.broadcast_to(np.asarray(total, dtype=float).reshape(-1), (rows,))
+            target = total[row_ids] * limit
+            if limit_type == "percent":
+                keep = np.bincount(
+                    row_ids, weights=sorted_abs >= target, minlength=rows
+                ).astype(int)
+            else:
+                cumulative = np.cumsum(sorted_abs)
+                offsets = np.concatenate(([0], cumulative))[csr.indptr[:-1]]
+                below = cumulative - offsets[row_ids] < target
+                keep = np.minimum(
+                    np.bincount(row_ids, weights=below, minlength=rows).astype(int) + 1,
+                    counts,
+                )
 
-    def top_matrix(self, matrix, rows=5, cols=5):
+        # Sorting keeps each row in its ``indptr`` segment, so ``row_ids`` and ``positions`` still apply
+        kept = positions < keep[row_ids]
+        results = np.full((rows, keep.max(initial=0), 2), np.nan)
+        results[row_ids[kept], positions[kept], 0] = csr.data[order[kept]]
+        results[row_ids[kept], positions[kept], 1] = csr.indices[order[kept]]
+        return results
+
+    def _sort_rows(self, data, limit, limit_type, total):
+        """Vectorized ``sort_array`` for each row of a 2-d array."""
+        abs_data = np.abs(data)
+        if total is None and limit_type != "number":
+            total = abs_data.sum(axis=1)
+        counts = None
+        if limit_type == "cumulative":
+            indices, counts = cumulative_indices(abs_data, limit, total)
+            indices = indices[:, : counts.max(initial=0)]
+        else:
+            if limit_type == "percent":
+                counts = (abs_data >= (np.reshape(total, (-1, 1)) * limit)).sum(axis=1)
+                limit = counts.max(initial=0)
+            indices = top_indices(abs_data, int(limit))
+
+        results = np.stack(
+            (np.take_along_axis(data, indices, axis=1), indices), axis=-1
+        ).astype(float)
+        if counts is not None:
+            results[np.arange(indices.shape[1]) >= counts.reshape((-1, 1))] = np.nan
+        return results
+
+    def top_matrix(self, matrix, rows=5, cols=5, limit_type="number"):
         """
         Find most important (i.e. highest summed) rows and columns in a matrix, as well as the most corresponding non-zero individual elements in the top rows and columns.
 
@@ -80,31 +399,64 @@ class ContributionAnalysis:
             )
 
         Args:
-            * *matrix* (array or matrix): Any Python object that supports the ``.sum(axis=)`` syntax.
+            * *matrix* (array or matrix): A numpy array or scipy sparse matrix.
             * *rows* (int): Number of rows to select.
             * *cols* (int): Number of columns to select.
+            * *limit_type* (str, default=``number``): How ``rows`` and ``cols`` are interpreted, see ``sort_array``.
 
         Returns:
             (elements, top rows, top columns)
         """
-        top_rows = np.argsort(np.abs(np.array(matrix.sum(axis=1)).ravel()))[
-            : -rows - 1 : -1
-        ]
-        top_cols = np.argsort(np.abs(np.array(matrix.sum(axis=0)).ravel()))[
-            : -cols - 1 : -1
-        ]
-        elements = []
-        for row, x in enumerate(top_rows):
-            for col, y in enumerate(top_cols):
-                if matrix[x, y] != 0:
-                    elements.append((x, y, row, col, float(matrix[x, y])))
-        return elements, top_rows.astype(int), top_cols.astype(int)
-
-    def hinton_matrix(self, lca, rows=5, cols=5):
-        coo, b, t = self.top_matrix(lca.characterized_inventory, rows=rows, cols=cols)
-        coo = [row[2:] for row in coo]  # Don't need matrix indices
-        flows = [self.get_name(lca.dicts.biosphere.reversed[x]) for x in b]
-        activities = [self.get_name(lca.dicts.activity.reversed[x]) for x in t]
+        (x, y, row, col, values), top_rows, top_cols = self.top_matrix_arrays(
+            matrix, rows=rows, cols=cols, limit_type=limit_type
+        )
+        elements = list(
+            zip(x.tolist(), y.tolist(), row.tolist(), col.tolist(), values.tolist())
+        )
+        return elements, top_rows, top_cols
+
+    def top_matrix_arrays(self, matrix, rows=5, cols=5, limit_type="number"):
+        """
+        Same as ``top_matrix``, but returns the elements as a tuple of arrays instead of a list of tuples: ``(rows, cols, row indices in top rows, col indices in top cols, values)``.
+
+        Sparse matrices are sliced once to the top rows and columns, and the non-zero elements are read from the COO form of this submatrix.
+
+        Returns:
+            (elements, top rows, top columns)
+        """
+        top_rows = self.top_emissions(matrix, limit=rows, limit_type=limit_type)
+        top_cols = self.top_processes(matrix, limit=cols, limit_type=limit_type)
+        top_rows, top_cols = top_rows[:, 1].astype(int), top_cols[:, 1].astype(int)
+
+        if sparse.issparse(matrix):
+            if matrix.format not in ("csr", "csc"):
+                matrix = matrix.tocsr()
+            submatrix = matrix[top_rows, :][:, top_cols].tocoo()
+            row, col, values = submatrix.row, submatrix.col, submatrix.data
+        else:
+            submatrix = np.asarray(matrix)[np.ix_(top_rows, top_cols)]
+            row, col = np.nonzero(submatrix)
+            values = submatrix[row, col]
+
+        mask = values != 0
+        row, col, values = row[mask], col[mask], values[mask].astype(float)
+        order = np.lexsort((col, row))
+        row, col, values = row[order], col[order], values[order]
+        return (
+            (top_rows[row], top_cols[col], row, col, values),
+            top_rows,
+            top_cols,
+        )
+
+    def hinton_matrix(self, lca, rows=5, cols=5, limit_type="number"):
+        self.result_context(lca)
+        (_, _, row, col, values), b, t = self.top_matrix_arrays(
+            lca.characterized_inventory, rows=rows, cols=cols, limit_type=limit_type
+        )
+        # Don't need matrix indices
+        coo = list(zip(row.tolist(), col.tolist(), values.tolist()))
+        flows = self.get_names([lca.dicts.biosphere.reversed[x] for x in b])
+        activities = self.get_names([lca.dicts.activity.reversed[x] for x in t])
         return {
             "results": coo,
             "total": lca.score,
@@ -117,54 +469,278 @@ class ContributionAnalysis:
         return [(row[0], rev_mapping[row[1]]) for row in sorted_data]
 
     def top_processes(self, matrix, **kwargs):
-        """Return an array of [value, index] technosphere processes."""
-        return self.sort_array(np.array(matrix.sum(axis=0)).ravel(), **kwargs)
+        """Return an array of [value, index] technosphere processes.
+
+        For sparse matrices, only processes with stored values are ranked."""
+        sums = self.marginal_sums(matrix)
+        if sparse.issparse(matrix):
+            return self.sort_array(sums.sparse_col_sums, **kwargs)
+        return self.sort_array(sums.col_sums, **kwargs)
 
     def top_emissions(self, matrix, **kwargs):
-        """Return an array of [value, index] biosphere emissions."""
-        return self.sort_array(np.array(matrix.sum(axis=1)).ravel(), **kwargs)
+        """Return an array of [value, index] biosphere emissions.
 
-    def annotated_top_processes(self, lca, names=True, **kwargs):
+        For sparse matrices, only emissions with stored values are ranked."""
+        sums = self.marginal_sums(matrix)
+        if sparse.issparse(matrix):
+            return self.sort_array(sums.sparse_row_sums, **kwargs)
+        return self.sort_array(sums.row_sums, **kwargs)
+
+    def annotated_top_processes(self, lca, names=True, columnar=False, **kwargs):
         """Get list of most damaging processes in an LCA, sorted by ``abs(direct impact)``.
 
         Returns a list of tuples: ``(lca score, supply, activity)``. If ``names`` is False, they returns the process key as the last element.
 
+        If ``columnar``, return a ``ContributionResults`` object instead; its metadata is only loaded when needed.
+
         """
+        context = self.result_context(lca)
+        sorted_data = self.top_processes(lca.characterized_inventory, **kwargs)
+        if columnar:
+            indices = sorted_data[:, 1].astype(int)
+            return ContributionResults(
+                score=sorted_data[:, 0],
+                amount=lca.supply_array[indices],
+                index=indices,
+                ids=context.ids("activity")[indices],
+            )
         results = [
             (
                 score,
                 lca.supply_array[int(index)],
                 lca.dicts.activity.reversed[int(index)],
             )
-            for score, index in self.top_processes(
-                lca.characterized_inventory, **kwargs
-            )
+            for score, index in sorted_data
         ]
         if names:
             results = [(x[0], x[1], get_activity(x[2])) for x in results]
         return results
 
-    def annotated_top_emissions(self, lca, names=True, **kwargs):
+    def annotated_top_emissions(self, lca, names=True, columnar=False, **kwargs):
         """Get list of most damaging biosphere flows in an LCA, sorted by ``abs(direct impact)``.
 
         Returns a list of tuples: ``(lca score, inventory amount, activity)``. If ``names`` is False, they returns the process key as the last element.
 
+        If ``columnar``, return a ``ContributionResults`` object instead; its metadata is only loaded when needed.
+
         """
+        context = self.result_context(lca)
+        inventory = context.inventory.row_sums
+        sorted_data = self.top_emissions(lca.characterized_inventory, **kwargs)
+        if columnar:
+            indices = sorted_data[:, 1].astype(int)
+            return ContributionResults(
+                score=sorted_data[:, 0],
+                amount=inventory[indices],
+                index=indices,
+                ids=context.ids("biosphere")[indices],
+            )
         results = [
-            (score, lca.inventory[int(index), :].sum(), lca.dicts.biosphere.reversed[int(index)])
-            for score, index in self.top_emissions(
-                lca.characterized_inventory, **kwargs
+            (
+                score,
+                inventory[int(index)],
+                lca.dicts.biosphere.reversed[int(index)],
             )
+            for score, index in sorted_data
         ]
         if names:
             results = [(x[0], x[1], get_activity(x[2])) for x in results]
         return results
 
+    def group_indicator(self, lca, field, kind="activities", default="Unknown"):
+        """Build a sparse indicator matrix which maps activities (or biosphere flows) to groups.
+
+        Groups are given by the values of ``field`` in the node metadata, e.g. ``"location"`` or ``"database"``. ``field`` can also be a function which takes the node data dictionary and returns the group label, e.g. to group by an ISIC classification. Nodes without this field are put in the ``default`` group.
+
+        The metadata of all nodes is fetched in bulk. Indicator matrices for metadata fields (but not for functions) are cached in the LCA's ``ResultContext``.
+
+        Args:
+            * *lca* (``LCA``): LCA object with ``dicts``.
+            * *field* (str or callable): Metadata field, or function to get the group label.
+            * *kind* (str, default=``activities``): Group ``activities`` (matrix columns) or ``flows`` (matrix rows).
+            * *default* (object, default=``"Unknown"``): Label for nodes without ``field``.
+
+        Returns:
+            ``(sparse matrix of shape (nodes, groups), list of group labels)``
+
+        """
+        if kind not in ("activities", "flows"):
+            raise ValueError("kind must be either 'activities' or 'flows'.")
+        context = self.result_context(lca)
+        # Functions are not cached, as each new lambda would add an entry that is never freed
+        cache_key = None if callable(field) else (kind, field, default)
+        if cache_key in context.indicators:
+            return context.indicators[cache_key]
+
+        ids = context.ids("activity" if kind == "activities" else "biosphere")
+        nodes = resolver.get_many(ids.tolist())
+        if callable(field):
+            labels = [field(data) for data in nodes]
+        else:
+            labels = [data.get(field, default) for data in nodes]
+        # Lists (e.g. ``categories``) can't be used as dictionary keys
+        labels = [tuple(x) if isinstance(x, list) else x for x in labels]
+        groups = {}
+        columns = np.array(
+            [groups.setdefault(label, len(groups)) for label in labels], dtype=int
+        )
+        indicator = sparse.csr_matrix(
+            (np.ones(len(labels)), (np.arange(len(labels)), columns)),
+            shape=(len(labels), len(groups)),
+        )
+        result = (indicator, list(groups))
+        if cache_key is not None:
+            context.indicators[cache_key] = result
+        return result
+
+    def grouped_matrix(self, lca, field, kind="activities", default="Unknown"):
+        """Aggregate ``characterized_inventory`` by group with one sparse matrix product.
+
+        For ``activities``, returns a ``(flows, groups)`` matrix; for ``flows``, a ``(groups, activities)`` matrix. See ``group_indicator`` for the arguments.
+
+        Returns:
+            ``(sparse matrix, list of group labels)``
+
+        """
+        indicator, labels = self.group_indicator(lca, field, kind, default)
+        if kind == "activities":
+            return lca.characterized_inventory @ indicator, labels
+        else:
+            return (indicator.T @ lca.characterized_inventory).tocsr(), labels
+
+    def grouped_contributions(
+        self, lca, field, kind="activities", default="Unknown", **kwargs
+    ):
+        """Get the LCA score per group, sorted by ``abs(score)``.
+
+        Group totals are the product of the indicator matrix and the cached column (or row) sums of ``characterized_inventory``. See ``group_indicator`` for the arguments; other keyword arguments are passed to ``sort_array``.
+
+        Returns a list of tuples: ``(lca score, group label)``.
+
+        """
+        indicator, labels = self.group_indicator(lca, field, kind, default)
+        sums = self.result_context(lca).characterized
+        totals = indicator.T @ (
+            sums.col_sums if kind == "activities" else sums.row_sums
+        )
+        return [
+            (float(score), labels[int(index)])
+            for score, index in self.sort_array(totals, **kwargs)
+        ]
+
+    def _aligned_inventories(self, lcas):
+        """Remap the ``characterized_inventory`` of each LCA to the union of their activity and biosphere index spaces.
+
+        Returns ``(matrices, activity ids, biosphere ids)``; the id arrays give the id for each row or column of the remapped matrices.
+        """
+        unions = {}
+        remaps = {}
+        for label in ("activity", "biosphere"):
+            ids = [
+                np.fromiter(getattr(lca.dicts, label).keys(), dtype=np.int64)
+                for lca in lcas
+            ]
+            unions[label] = np.unique(np.concatenate(ids))
+            remaps[label] = []
+            for lca, these_ids in zip(lcas, ids):
+                remap = np.empty(len(these_ids), dtype=np.int64)
+                positions = np.fromiter(
+                    getattr(lca.dicts, label).values(), dtype=np.int64
+                )
+                remap[positions] = np.searchsorted(unions[label], these_ids)
+                remaps[label].append(remap)
+
+        shape = (len(unions["biosphere"]), len(unions["activity"]))
+        matrices = []
+        for lca, bio_remap, act_remap in zip(
+            lcas, remaps["biosphere"], remaps["activity"]
+        ):
+            coo = lca.characterized_inventory.tocoo()
+            matrices.append(
+                sparse.csc_matrix(
+                    (coo.data, (bio_remap[coo.row], act_remap[coo.col])), shape=shape
+                )
+            )
+        return matrices, unions["activity"], unions["biosphere"]
+
+    def scenario_delta(self, baseline, scenario, limit=25, limit_type="number"):
+        """Compare the contributions of two LCA results, e.g. a baseline and a scenario, by process and by flow.
+
+        The two LCAs don't need to have the same matrices; their index spaces are aligned by activity and biosphere id. The characterized inventories are subtracted as sparse matrices, and are never densified.
+
+        Returns a dictionary:
+
+        .. code-block:: python
+
+            {
+                "processes": {
+                    "absolute": [(change, relative change, baseline score, scenario score, id)],
+                    "relative": [...]
+                },
+                "flows": {"absolute": [...], "relative": [...]},
+                "delta": sparse matrix (scenario - baseline),
+                "activities": array of activity ids (columns of ``delta``),
+                "biosphere": array of biosphere flow ids (rows of ``delta``),
+            }
+
+        ``absolute`` is sorted by ``abs(change)``, and ``relative`` by ``abs(change / baseline score)``. The relative change is ``nan`` when the baseline score is zero; these elements are not included in ``relative``.
+
+        Args:
+            * *baseline* (``LCA``): LCA object with ``characterized_inventory``.
+            * *scenario* (``LCA``): LCA object with ``characterized_inventory``.
+            * *limit* and *limit_type*: Passed to ``sort_array``.
+
+        """
+        (base, scen), activities, biosphere = self._aligned_inventories(
+            [baseline, scenario]
+        )
+        delta = scen - base
+        results = {"delta": delta, "activities": activities, "biosphere": biosphere}
+
+        for label, axis, ids in (("processes", 0, activities), ("flows", 1, biosphere)):
+            base_scores = np.array(base.sum(axis=axis)).ravel()
+            scen_scores = np.array(scen.sum(axis=axis)).ravel()
+            change = np.array(delta.sum(axis=axis)).ravel()
+            relative = np.full(change.shape, np.nan)
+            np.divide(change, np.abs(base_scores), out=relative, where=base_scores != 0)
+            columns = (change, relative, base_scores, scen_scores)
+
+            by_relative = self.sort_array(
+                np.nan_to_num(relative), limit=limit, limit_type=limit_type
+            )
+            results[label] = {
+                "absolute": self._delta_rows(
+                    self.sort_array(change, limit=limit, limit_type=limit_type),
+                    columns,
+                    ids,
+                ),
+                "relative": self._delta_rows(
+                    by_relative[by_relative[:, 0] != 0], columns, ids
+                ),
+            }
+        return results
+
+    def _delta_rows(self, sorted_data, columns, ids):
+        return [
+            tuple(float(column[index]) for column in columns) + (int(ids[index]),)
+            for index in sorted_data[:, 1].astype(int)
+        ]
+
     def get_name(self, key):
-        return get_activity(key).get("name", "Unknown")
+        return resolver.get(key, "name", "Unknown")
+
+    def get_names(self, keys):
+        """Get the names of many activities or flows with one bulk lookup."""
+        return resolver.names(keys)
 
     def d3_treemap(
-        self, matrix, rev_bio, rev_techno, limit=0.025, limit_type="percent"
+        self,
+        matrix,
+        rev_bio,
+        rev_techno,
+        limit=0.025,
+        limit_type="percent",
+        children=True,
     ):
         """
         Construct treemap input data structure for LCA result. Output like:
@@ -182,34 +758,64 @@ class ContributionAnalysis:
                 }]
             }
 
+        The matrix is converted to CSC once; column totals are computed in one pass (or reused, see ``marginal_sums``), and the emissions of each selected process are read directly from the stored values of its column. All names are looked up together with one bulk query.
+
+        Set ``children`` to ``False`` to only return the process level.
+
         """
-        total = np.abs(matrix).sum()
-        processes = self.top_processes(matrix, limit=limit, limit_type=limit_type)
-        data = {"name": "LCA result", "children": [], "size": total}
-        for _, tech_index in processes:
-            name = self.get_name(rev_techno[tech_index])
-            this_score = np.abs(matrix[:, int(tech_index)].toarray().ravel()).sum()
-            children = []
-            for score, bio_index in self.sort_array(
-                matrix[:, int(tech_index)].toarray().ravel(),
-                limit=limit,
-                limit_type=limit_type,
-                total=total,
-            ):
-                children.append(
-                    {
-                        "name": self.get_name(rev_bio[bio_index]),
-                        "size": float(abs(matrix[int(bio_index), int(tech_index)])),
-                    }
+        if not sparse.issparse(matrix):
+            matrix = sparse.csc_matrix(matrix)
+        # Rank processes with the same (possibly cached) sums; ``top_processes``
+        # would look them up again for the converted matrix
+        sums = self.marginal_sums(matrix)
+        column_totals, total = sums.abs_col_sums, sums.abs_total
+        processes = self.sort_array(
+            sums.sparse_col_sums, limit=limit, limit_type=limit_type
+        )
+        matrix = sparse.csc_matrix(matrix)
+        tech_indices = processes[:, 1].astype(int)
+
+        columns = []
+        for tech_index in tech_indices:
+            start, end = matrix.indptr[tech_index], matrix.indptr[tech_index + 1]
+            if children:
+                selected = self.sort_array(
+                    matrix.data[start:end],
+                    limit=limit,
+                    limit_type=limit_type,
+                    # Cumulative share of this process, not of the total score
+                    total=(
+                        column_totals[tech_index]
+                        if limit_type == "cumulative"
+                        else total
+                    ),
                 )
-            children_score = sum([x["size"] for x in children])
-            if children_score < (0.95 * this_score):
-                children.append({"name": "Others", "size": this_score - children_score})
-            data["children"].append(
-                {
-                    "name": name,
-                    "size": this_score,
-                    # "children": children
-                }
+                bio_indices = matrix.indices[start:end][selected[:, 1].astype(int)]
+                sizes = np.abs(selected[:, 0])
+            else:
+                bio_indices, sizes = np.zeros(0, dtype=int), np.zeros(0)
+            columns.append((tech_index, bio_indices, sizes))
+
+        keys = list(
+            {rev_techno[int(index)] for index in tech_indices}.union(
+                rev_bio[int(index)] for _, bio, _ in columns for index in bio
             )
+        )
+        names = dict(zip(keys, self.get_names(keys)))
+
+        data = {"name": "LCA result", "children": [], "size": total}
+        for tech_index, bio_indices, sizes in columns:
+            this_score = float(column_totals[tech_index])
+            node = {"name": names[rev_techno[int(tech_index)]], "size": this_score}
+            if children:
+                node["children"] = [
+                    {"name": names[rev_bio[int(bio_index)]], "size": float(size)}
+                    for bio_index, size in zip(bio_indices, sizes)
+                ]
+                children_score = float(sizes.sum())
+                if children_score < (0.95 * this_score):
+                    node["children"].append(
+                        {"name": "Others", "size": this_score - children_score}
+                    )
+            data["children"].append(node)
         return data
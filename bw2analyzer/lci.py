@@ -1,7 +1,8 @@
 import pandas as pd
-from bw2data import get_activity
 from bw2calc import LCA
 
+from .metadata import resolver
+
 
 def get_labeled_inventory(lca: LCA) -> pd.DataFrame:
     """
@@ -18,14 +19,12 @@ def get_labeled_inventory(lca: LCA) -> pd.DataFrame:
         lca, "inventory"
     ), "Must calculate life cycle inventory first. Please call lci()."
 
-    rows = [
-        get_activity(lca.dicts.biosphere.reversed[i]).as_dict()
-        for i in range(lca.inventory.shape[0])
-    ]
-    columns = [
-        get_activity(lca.dicts.activity.reversed[i]).as_dict()
-        for i in range(lca.inventory.shape[1])
-    ]
+    rows = resolver.get_many(
+        [lca.dicts.biosphere.reversed[i] for i in range(lca.inventory.shape[0])]
+    )
+    columns = resolver.get_many(
+        [lca.dicts.activity.reversed[i] for i in range(lca.inventory.shape[1])]
+    )
 
     return pd.DataFrame(
         data=lca.inventory.todense(),
@@ -0,0 +1,117 @@
+import functools
+import operator
+from collections import OrderedDict
+
+from bw2data import databases, projects
+from bw2data.backends import ActivityDataset
+
+
+class MetadataResolver:
+    """Look up the metadata of many nodes at once, with a bounded LRU cache.
+
+    Nodes can be given as integer ids or as ``(database, code)`` keys. Uncached nodes are fetched together, with one query per ``chunk_size`` nodes, instead of one ``get_activity`` call per node.
+
+    The cache is cleared when the current project changes, or when any database is modified (e.g. by ``Activity.save()`` or ``Database.write()``).
+
+    Returned dictionaries are shared with the cache and should not be modified.
+
+    Args:
+        * *maxsize* (int, default=100000): Maximum number of cached nodes.
+        * *chunk_size* (int, default=500): Maximum number of nodes per query. Must be below the SQLite variable limit.
+
+    """
+
+    def __init__(self, maxsize=100000, chunk_size=500):
+        self.maxsize = maxsize
+        self.chunk_size = chunk_size
+        self.clear()
+
+    def clear(self):
+        self._cache = OrderedDict()
+        self._key_ids = {}
+        self._state = None
+
+    def _check_state(self):
+        state = (
+            projects.current,
+            tuple(
+                sorted((name, meta.get("modified")) for name, meta in databases.items())
+            ),
+        )
+        if state != self._state:
+            self.clear()
+            self._state = state
+
+    def _query(self, condition):
+        for obj in ActivityDataset.select().where(condition):
+            data = dict(obj.data, code=obj.code, database=obj.database, id=obj.id)
+            self._key_ids[(obj.database, obj.code)] = obj.id
+            self._cache[obj.id] = data
+
+    def _fetch(self, identifiers):
+        ids = [x for x in identifiers if not isinstance(x, tuple)]
+        keys = [x for x in identifiers if isinstance(x, tuple)]
+        for start in range(0, len(ids), self.chunk_size):
+            self._query(ActivityDataset.id << ids[start : start + self.chunk_size])
+        for start in range(0, len(keys), self.chunk_size):
+            by_database = {}
+            for database, code in keys[start : start + self.chunk_size]:
+                by_database.setdefault(database, []).append(code)
+            self._query(
+                functools.reduce(
+                    operator.or_,
+                    [
+                        (ActivityDataset.database == database)
+                        & (ActivityDataset.code << codes)
+                        for database, codes in by_database.items()
+                    ],
+                )
+            )
+
+    def get_many(self, identifiers, fields=None):
+        """Get metadata for many nodes.
+
+        Args:
+            * *identifiers* (iterable): Node ids or ``(database, code)`` keys. Can be mixed.
+            * *fields* (iterable, optional): Only return these fields. Default is to return all fields.
+
+        Returns:
+            List of dictionaries, in the same order as ``identifiers``. Unknown nodes get an empty dictionary.
+
+        """
+        self._check_state()
+        identifiers = [
+            tuple(x) if isinstance(x, (tuple, list)) else int(x) for x in identifiers
+        ]
+        missing = {x for x in identifiers if self._key_ids.get(x, x) not in self._cache}
+        if missing:
+            self._fetch(list(missing))
+
+        results = []
+        for identifier in identifiers:
+            id_ = self._key_ids.get(identifier, identifier)
+            data = self._cache.get(id_)
+            if data is None:
+                data = {}
+            else:
+                self._cache.move_to_end(id_)
+            if fields is not None:
+                data = {field: data[field] for field in fields if field in data}
+            results.append(data)
+
+        while len(self._cache) > self.maxsize:
+            _, data = self._cache.popitem(last=False)
+            self._key_ids.pop((data["database"], data["code"]), None)
+        return results
+
+    def get(self, identifier, field=None, default=None):
+        """Get the metadata dictionary of one node, or only its ``field`` value."""
+        data = self.get_many([identifier])[0]
+        return data if field is None else data.get(field, default)
+
+    def names(self, identifiers, default="Unknown"):
+        """Get a list of node names."""
+        return [data.get("name", default) for data in self.get_many(identifiers)]
+
+
+resolver = MetadataResolver()
@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from tqdm import tqdm
+
+
+class SweepMonitor:
+    """Collect throughput statistics of a long-running sweep over many datasets, and pass them to sinks.
+
+    The sweep reports progress with ``advance``, times its phases with ``phase`` (or adds timings measured elsewhere, e.g. in worker processes, with ``add_timings``), and reports the memory used by its results with ``memory``. After each call to ``advance``, every sink gets the current ``metrics``:
+
+    * ``completed``, ``total``: Number of datasets
+    * ``elapsed``: Seconds since the start
+    * ``rate``: Datasets per second
+    * ``eta``: Estimated seconds until the sweep is finished, or ``None`` before the first dataset is finished
+    * ``phases``: Cumulative seconds per phase, e.g. ``{"solve": 12.5, "lcia": 3.1}``
+    * ``peak_memory``: Largest reported memory use of the results, in bytes
+
+    Sinks are objects with ``update(metrics)`` and ``close(metrics)`` methods; see ``ProgressSink``.
+
+    Args:
+        * *total* (int): Number of datasets in the sweep.
+        * *sinks* (list, optional): Sinks which receive the metrics.
+
+    """
+
+    def __init__(self, total, sinks=()):
+        self.total = total
+        self.sinks = list(sinks)
+        self.completed = 0
+        self.phases = defaultdict(float)
+        self.peak_memory = 0
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager which adds the time spent in its block to phase ``name``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def add_timings(self, timings):
+        """Add a dictionary of ``{phase: seconds}`` to the cumulative phase timings."""
+        for name, seconds in timings.items():
+            self.phases[name] += seconds
+
+    def memory(self, nbytes):
+        """Report the current memory use of the results."""
+        self.peak_memory = max(self.peak_memory, nbytes)
+
+    def metrics(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        return {
+            "completed": self.completed,
+            "total": self.total,
+            "elapsed": elapsed,
+            "rate": rate,
+            "eta": (self.total - self.completed) / rate if rate else None,
+            "phases": dict(self.phases),
+            "peak_memory": self.peak_memory,
+        }
+
+    def advance(self, number=1):
+        """Mark ``number`` more datasets as finished, and update all sinks."""
+        self.completed += number
+        metrics = self.metrics()
+        for sink in self.sinks:
+            sink.update(metrics)
+
+    def close(self):
+        metrics = self.metrics()
+        for sink in self.sinks:
+            sink.close(metrics)
+        return metrics
+
+
+class ProgressSink:
+    """Base class for ``SweepMonitor`` sinks, which are updated at most every ``interval`` seconds, and always when closed."""
+
+    def __init__(self, interval=0):
+        self.interval = interval
+        self._last = None
+
+    def update(self, metrics):
+        now = time.perf_counter()
+        if self._last is None or now - self._last >= self.interval:
+            self._last = now
+            self.emit(metrics)
+
+    def close(self, metrics):
+        self.emit(metrics)
+
+    def emit(self, metrics):
+        raise NotImplementedError
+
+
+class TqdmSink(ProgressSink):
+    """Show a ``tqdm`` progress bar, with the share of time spent in each phase as postfix."""
+
+    def __init__(self, interval=0, **kwargs):
+        super().__init__(interval)
+        self.kwargs = kwargs
+        self.bar = None
+
+    def emit(self, metrics):
+        if self.bar is None:
+            self.bar = tqdm(total=metrics["total"], **self.kwargs)
+        self.bar.update(metrics["completed"] - self.bar.n)
+        phases_total = sum(metrics["phases"].values())
+        if phases_total:
+            self.bar.set_postfix(
+                {
+                    name: "{:.0%}".format(seconds / phases_total)
+                    for name, seconds in metrics["phases"].items()
+                },
+                refresh=False,
+            )
+
+    def close(self, metrics):
+        super().close(metrics)
+        self.bar.close()
+
+
+class LoggingSink(ProgressSink):
+    """Log metrics as one structured record, with the metrics dictionary in the ``metrics`` attribute of the log record.
+
+    Args:
+        * *logger* (``logging.Logger``, optional): Default is the ``bw2analyzer.progress`` logger.
+        * *level* (int, default=``logging.INFO``): Log level.
+        * *interval* (number, default=60): Minimum seconds between records.
+
+    """
+
+    def __init__(self, logger=None, level=logging.INFO, interval=60):
+        super().__init__(interval)
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def emit(self, metrics):
+        self.logger.log(
+            self.level,
+            "%d/%d datasets, %.1f/s, ETA %s s, phases %s, peak memory %d bytes",
+            metrics["completed"],
+            metrics["total"],
+            metrics["rate"],
+            "?" if metrics["eta"] is None else "{:.0f}".format(metrics["eta"]),
+            {name: round(seconds, 3) for name, seconds in metrics["phases"].items()},
+            metrics["peak_memory"],
+            extra={"metrics": metrics},
+        )
+
+
+class JSONMetricsSink(ProgressSink):
+    """Write the latest metrics to a JSON file, replacing it atomically so that it can be read at any time.
+
+    Args:
+        * *filepath* (str): Path of the JSON file.
+        * *interval* (number, default=10): Minimum seconds between writes.
+
+    """
+
+    def __init__(self, filepath, interval=10):
+        super().__init__(interval)
+        self.filepath = filepath
+
+    def emit(self, metrics):
+        temp_filepath = self.filepath + ".tmp"
+        with open(temp_filepath, "w") as f:
+            json.dump(metrics, f)
+        os.replace(temp_filepath, self.filepath)
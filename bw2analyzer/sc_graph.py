@@ -2,7 +2,9 @@ import copy
 import itertools
 from heapq import heappop, heappush
 
-from bw2data import config, get_activity
+from bw2data import config
+
+from .metadata import resolver
 
 
 def tupify(o):
@@ -85,6 +87,12 @@ class GTManipulator:
     def add_metadata(nodes, lca):
         """Add metadata to nodes, like name, unit, and category."""
         new_nodes = {}
+        codes = [
+            lca.dicts.activity.reversed[value.get("row", key)]
+            for key, value in nodes.items()
+            if key != -1
+        ]
+        metadata = dict(zip(codes, resolver.get_many(codes)))
         for key, value in nodes.items():
             new_value = copy.deepcopy(value)
             if key == -1:
@@ -101,7 +109,7 @@ class GTManipulator:
                 else:
                     index = key
                 code = lca.dicts.activity.reversed[index]
-                ds = get_activity(code)
+                ds = metadata[code]
                 new_value.update(
                     {
                         "name": ds.get("name", "Unknown"),
@@ -203,6 +211,8 @@ class GTManipulator:
         child_nodes = lambda node, edges: [e["from"] for e in edges if e["to"] == node]
 
         counter = itertools.count(1)
+        keys = [ra[value.get("row", key)] for key, value in nodes.items() if key != -1]
+        metadata = dict(zip(keys, resolver.get_many(keys)))
 
         def format_node(node_key, node_data, ra):
             if node_key == -1:
@@ -217,8 +227,7 @@ class GTManipulator:
 
             if "row" in node_data:
                 node_key = node_data["row"]
-            key = ra[node_key]
-            ds = get_activity(key)
+            ds = metadata[ra[node_key]]
             return {
                 "name": ds.get("name", "Unknown"),
                 "unit": ds.get("unit", "Unknown"),
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from .contribution import MarginalSums, top_indices
+
+
+class ContributionStability:
+    """Streaming statistics on how stable contribution rankings are across Monte Carlo iterations.
+
+    Add the ``characterized_inventory`` of each iteration with ``add``. Only running statistics are kept, so memory use is fixed at ``size * (limit + 3)`` numbers, independent of the number of iterations:
+
+    * Running mean and variance of the contribution of each activity (or flow)
+    * How often each activity was in the top ``limit``
+    * A histogram of the rank of each activity, for ranks ``0`` to ``limit - 1``
+
+    Usage:
+
+    .. code-block:: python
+
+        mc = bc.MonteCarloLCA({activity: 1}, method)
+        stability = ContributionStability(limit=25)
+        for _ in range(10000):
+            next(mc)
+            stability.add(mc.characterized_inventory)
+        df = stability.finalize(as_dataframe=True)
+
+    Args:
+        * *limit* (int, default=25): Number of top contributors to count in each iteration.
+        * *kind* (str, default=``activities``): Rank ``activities`` (column sums) or ``flows`` (row sums).
+        * *size* (int, optional): Number of activities or flows. Taken from the first matrix if not given.
+
+    """
+
+    def __init__(self, limit=25, kind="activities", size=None):
+        if kind not in ("activities", "flows"):
+            raise ValueError("kind must be either 'activities' or 'flows'.")
+        self.limit = limit
+        self.kind = kind
+        self.count = 0
+        self.size = None
+        if size is not None:
+            self._allocate(size)
+
+    def _allocate(self, size):
+        self.size = size
+        self.limit = min(self.limit, size)
+        self.mean = np.zeros(size)
+        self._m2 = np.zeros(size)
+        self.top_counts = np.zeros(size, dtype=np.int64)
+        self.rank_counts = np.zeros((size, self.limit), dtype=np.int64)
+
+    def add(self, matrix):
+        """Add the ``characterized_inventory`` (or any matrix of the same shape) of one iteration."""
+        sums = MarginalSums(matrix)
+        values = sums.col_sums if self.kind == "activities" else sums.row_sums
+        if self.size is None:
+            self._allocate(values.shape[0])
+        elif values.shape[0] != self.size:
+            raise ValueError(
+                "Expected {} values, got {}".format(self.size, values.shape[0])
+            )
+
+        # Welford's online algorithm
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (values - self.mean)
+
+        top = top_indices(np.abs(values), self.limit)
+        self.top_counts[top] += 1
+        self.rank_counts[top, np.arange(top.shape[0])] += 1
+
+    @property
+    def variance(self):
+        """Sample variance of each contribution; ``nan`` for fewer than two iterations."""
+        if self.count < 2:
+            return np.full(self.size, np.nan)
+        return self._m2 / (self.count - 1)
+
+    def finalize(self, as_dataframe=False):
+        """Return the statistics collected so far.
+
+        Returns a dictionary of arrays, with one row per activity or flow:
+
+        * ``mean``: Mean contribution
+        * ``variance``, ``std``: Sample variance and standard deviation of the contribution
+        * ``top_frequency``: Fraction of iterations in which this activity was in the top ``limit``
+        * ``rank_frequency``: 2-d array; fraction of iterations with each rank
+
+        If ``as_dataframe``, return a pandas ``DataFrame`` instead, indexed by matrix index, with one ``rank_{n}`` column per rank, and sorted by ``top_frequency``.
+
+        """
+        if self.count == 0:
+            raise ValueError("No iterations added")
+        variance = self.variance
+        results = {
+            "mean": self.mean.copy(),
+            "variance": variance,
+            "std": np.sqrt(variance),
+            "top_frequency": self.top_counts / self.count,
+            "rank_frequency": self.rank_counts / self.count,
+        }
+        if not as_dataframe:
+            return results
+
+        rank_frequency = results.pop("rank_frequency")
+        df = pd.DataFrame(results)
+        for rank in range(self.limit):
+            df["rank_{}".format(rank)] = rank_frequency[:, rank]
+        df.index.name = "index"
+        return df.sort_values("top_frequency", ascending=False, kind="stable")
@@ -0,0 +1,425 @@
+import csv
+import heapq
+import itertools
+import json
+import string
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import linalg as spla
+
+from .metadata import resolver
+
+
+def unit_scores(lca):
+    """Calculate the LCA score of one unit of demand of every product, with one transposed solve.
+
+    The score of a demand vector ``d`` is ``c B A^-1 d``, where ``c`` sums the rows of the characterization matrix. The adjoint (or co-state) vector ``lambda = (A^T)^-1 (c B)^T`` therefore gives the score of ``amount`` of any product as ``amount * lambda[product index]``, so supply chain traversals don't need a linear solve per node.
+
+    ``lca`` must have loaded its technosphere, biosphere and characterization matrices, e.g. with ``lci()`` and ``lcia()``. Only valid for ``LCA`` classes where the score is ``characterization_matrix @ biosphere_matrix @ supply_array``, i.e. not for regionalized LCA.
+
+    Args:
+        * *lca* (``LCA``): LCA object.
+
+    Returns:
+        Numpy array with one score per product, indexed by ``lca.dicts.product``.
+
+    """
+    characterized_biosphere = lca.characterization_matrix @ lca.biosphere_matrix
+    return np.atleast_1d(
+        spla.spsolve(
+            lca.technosphere_matrix.T.tocsc(),
+            np.asarray(characterized_biosphere.sum(axis=0)).ravel(),
+        )
+    )
+
+
+class TechnosphereIndex:
+    """Adjacency index of the supply chain graph of an LCA, built from its technosphere matrix, for traversals with integer indices instead of database queries.
+
+    Nodes are activities, identified by their column index in ``lca.dicts.activity``. The inputs of each activity are stored in a CSC matrix, where column ``j`` has the activities supplying ``j``, and the amount of their reference product needed per unit of production of ``j``. The reference product of an activity is the product with the same id, or otherwise its largest positive value.
+
+    Amounts are taken from the matrix, so several exchanges between the same pair of nodes are summed, inputs with a positive matrix value (e.g. substitution) get a negative amount, and production is net of losses (inputs of the reference product). Products without a producing activity are skipped.
+
+    Args:
+        * *lca* (``LCA``): LCA object with a ``technosphere_matrix``, e.g. after ``load_lci_data()``.
+
+    """
+
+    def __init__(self, lca):
+        matrix = sparse.csc_matrix(lca.technosphere_matrix)
+        matrix.sum_duplicates()
+        cols = matrix.shape[1]
+        self.activity_ids = np.zeros(cols, dtype=np.int64)
+        for id_, col in lca.dicts.activity.items():
+            self.activity_ids[col] = id_
+
+        # Reference product row of each activity
+        self.product = np.full(cols, -1, dtype=np.int64)
+        for col, id_ in enumerate(self.activity_ids):
+            if id_ in lca.dicts.product:
+                self.product[col] = lca.dicts.product[id_]
+            else:
+                start, end = matrix.indptr[col], matrix.indptr[col + 1]
+                if end > start and matrix.data[start:end].max() > 0:
+                    self.product[col] = matrix.indices[
+                        start + np.argmax(matrix.data[start:end])
+                    ]
+        producer = np.full(matrix.shape[0], -1, dtype=np.int64)
+        has_product = self.product >= 0
+        producer[self.product[has_product]] = np.flatnonzero(has_product)
+        self.production = np.ones(cols)
+        self.production[has_product] = np.asarray(
+            matrix[self.product[has_product], np.flatnonzero(has_product)]
+        ).ravel()
+
+        coo = matrix.tocoo()
+        mask = (coo.row != self.product[coo.col]) & (producer[coo.row] >= 0)
+        self.inputs = sparse.csc_matrix(
+            (
+                -coo.data[mask] / self.production[coo.col[mask]],
+                (producer[coo.row[mask]], coo.col[mask]),
+            ),
+            shape=(cols, cols),
+        )
+        self.inputs.sort_indices()
+
+    def children(self, col):
+        """Return ``(indices, amounts)`` of the inputs of activity ``col``, per unit of its reference product."""
+        start, end = self.inputs.indptr[col], self.inputs.indptr[col + 1]
+        return self.inputs.indices[start:end], self.inputs.data[start:end]
+
+
+TraversalNode = namedtuple(
+    "TraversalNode", ["level", "parent", "ordinal", "index", "amount", "score"]
+)
+TraversalNode.__doc__ = """A node visited in a supply chain traversal. ``parent`` is the position of the parent node in the traversal (``None`` for the root), ``ordinal`` the position of this node among the inputs of its parent, ``index`` the activity index in ``TechnosphereIndex``, and ``score`` the result of the ``score`` function (or ``None``)."""
+
+
+def depth_first(index, col, amount, max_level, score=None, keep=None):
+    """Walk the supply chain of activity ``col`` of ``index`` (a ``TechnosphereIndex``) depth first, and yield a ``TraversalNode`` for each visited node, in the same order as a recursive traversal.
+
+    Uses an explicit stack, so deep supply chains don't hit the recursion limit.
+
+    Args:
+        * *index* (``TechnosphereIndex``): Adjacency index.
+        * *col* (int): Activity index of the root node.
+        * *amount* (float): Amount of the root node.
+        * *max_level* (int): Maximum depth to traverse.
+        * *score* (callable, optional): Called as ``score(col, amount)`` to get the score of each node.
+        * *keep* (callable, optional): Called as ``keep(amount, score)`` for each node except the root; nodes (and their supply chains) are skipped if this returns ``False``.
+
+    """
+    stack = [(0, None, 0, col, amount)]
+    position = 0
+    while stack:
+        level, parent, ordinal, col, amount = stack.pop()
+        node_score = None if score is None else score(col, amount)
+        if parent is not None and keep is not None and not keep(amount, node_score):
+            continue
+        yield TraversalNode(level, parent, ordinal, col, amount, node_score)
+        if level < max_level:
+            children, amounts = index.children(col)
+            for child in reversed(range(children.shape[0])):
+                stack.append(
+                    (
+                        level + 1,
+                        position,
+                        child,
+                        children[child],
+                        amount * amounts[child],
+                    )
+                )
+        position += 1
+
+
+def best_first(index, col, amount, max_nodes, score, max_level=None, keep=None):
+    """Walk the supply chain of activity ``col`` of ``index`` (a ``TechnosphereIndex``) best first, and yield a ``TraversalNode`` for the ``max_nodes`` nodes with the highest absolute scores, highest first.
+
+    Inputs of visited nodes are scored and put on a priority queue ordered by absolute score, and the node with the highest absolute score is visited next, independent of its depth. The run time therefore depends on ``max_nodes``, and not on how connected the graph is. Each node is yielded after its parent, but not in tree order; see ``depth_first_order``.
+
+    Args:
+        * *index* (``TechnosphereIndex``): Adjacency index.
+        * *col* (int): Activity index of the root node.
+        * *amount* (float): Amount of the root node.
+        * *max_nodes* (int): Maximum number of nodes to visit.
+        * *score* (callable): Called as ``score(col, amount)`` to get the score of each node.
+        * *max_level* (int, optional): Maximum depth to traverse.
+        * *keep* (callable, optional): Called as ``keep(amount, score)`` for each node except the root; nodes (and their supply chains) are skipped if this returns ``False``.
+
+    """
+    # The counter breaks ties in insertion order, so nodes are never compared
+    counter = itertools.count()
+    root_score = score(col, amount)
+    heap = [(-abs(root_score), next(counter), 0, None, 0, col, amount, root_score)]
+    position = 0
+    while heap and position < max_nodes:
+        _, _, level, parent, ordinal, col, amount, node_score = heapq.heappop(heap)
+        yield TraversalNode(level, parent, ordinal, col, amount, node_score)
+        if max_level is None or level < max_level:
+            children, amounts = index.children(col)
+            for child in range(children.shape[0]):
+                child_amount = amount * amounts[child]
+                child_score = score(children[child], child_amount)
+                if keep is not None and not keep(child_amount, child_score):
+                    continue
+                heapq.heappush(
+                    heap,
+                    (
+                        -abs(child_score),
+                        next(counter),
+                        level + 1,
+                        position,
+                        child,
+                        children[child],
+                        child_amount,
+                        child_score,
+                    ),
+                )
+        position += 1
+
+
+def depth_first_order(nodes):
+    """Reorder a list of ``TraversalNode`` (e.g. from ``best_first``) into depth-first tree order, with inputs ordered by ``ordinal``, and ``parent`` positions updated."""
+    children = [[] for _ in nodes]
+    for position, node in enumerate(nodes):
+        if node.parent is not None:
+            children[node.parent].append(position)
+    order = []
+    stack = [0] if nodes else []
+    while stack:
+        position = stack.pop()
+        order.append(position)
+        stack.extend(
+            sorted(children[position], key=lambda x: nodes[x].ordinal, reverse=True)
+        )
+    new_positions = {old: new for new, old in enumerate(order)}
+    return [
+        nodes[old]._replace(
+            parent=(
+                None if nodes[old].parent is None else new_positions[nodes[old].parent]
+            )
+        )
+        for old in order
+    ]
+
+
+def node_label(data):
+    """Format node metadata like ``str(Activity)``."""
+    return "'{}' ({}, {}, {})".format(
+        data.get("name"), data.get("unit"), data.get("location"), data.get("categories")
+    )
+
+
+def write_records(records, *sinks):
+    """Write each record of ``records`` (e.g. from ``bw2analyzer.utils.iter_recursive_calculation``) to every sink, as it is produced, and then close the sinks.
+
+    Sinks are objects with ``write(record)`` and ``close()`` methods, e.g. ``DataFrameSink``, ``CSVSink``, ``JSONLinesSink`` or ``TextSink``.
+
+    Returns:
+        The return value of ``close()`` of the sink, or a list of these if there are several sinks.
+
+    """
+    for record in records:
+        for sink in sinks:
+            sink.write(record)
+    results = [sink.close() for sink in sinks]
+    return results[0] if len(results) == 1 else results
+
+
+class DataFrameSink:
+    """Collect records in a pandas ``DataFrame``, optionally only with the columns ``fields``. Memory use grows with the number of records."""
+
+    def __init__(self, fields=None):
+        self.fields = fields
+        self.rows = []
+
+    def write(self, record):
+        if self.fields is not None:
+            record = {field: record[field] for field in self.fields}
+        self.rows.append(record)
+
+    def close(self):
+        return pd.DataFrame(self.rows, columns=self.fields)
+
+
+class JSONLinesSink:
+    """Write each record as one line of JSON to the file-like object ``file_obj``. The file is not closed."""
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+
+    def write(self, record):
+        self.file_obj.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.file_obj.flush()
+
+
+class CSVSink:
+    """Write records as CSV rows to the file-like object ``file_obj``, with a header row. Columns are ``fields``, or the fields of the first record. The file is not closed."""
+
+    def __init__(self, file_obj, fields=None):
+        self.file_obj = file_obj
+        self.fields = fields
+        self.writer = None
+
+    def write(self, record):
+        if self.writer is None:
+            self.writer = csv.DictWriter(
+                self.file_obj,
+                fieldnames=self.fields or list(record),
+                extrasaction="ignore",
+            )
+            self.writer.writeheader()
+        self.writer.writerow(record)
+
+    def close(self):
+        self.file_obj.flush()
+
+
+class TextSink:
+    """Print records in the format of ``print_recursive_calculation`` to ``file_obj`` (default ``sys.stdout``)."""
+
+    def __init__(self, file_obj=None, string_length=130, tab_character="  "):
+        self.file_obj = sys.stdout if file_obj is None else file_obj
+        self.string_length = string_length
+        self.tab_character = tab_character
+        self.first = True
+
+    def write(self, record):
+        if self.first:
+            self.file_obj.write(
+                "Fraction of score | Absolute score | Amount | Activity\n"
+            )
+            self.first = False
+        message = "{}{:04.3g} | {:5.4n} | {:5.4n} | {}".format(
+            self.tab_character * record["level"],
+            record["fraction"],
+            record["score"],
+            record["amount"],
+            record["activity"],
+        )
+        self.file_obj.write(message[: self.string_length] + "\n")
+
+    def close(self):
+        pass
+
+
+def alphabet_label(number):
+    """Return value ``number`` of ``bw2analyzer.utils.infinite_alphabet``, i.e. ``a`` to ``z``, then ``aa`` to ``az``, etc."""
+    label = ""
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        label = string.ascii_lowercase[remainder] + label
+    return label
+
+
+class SupplyChainTree:
+    """Compact columnar result of a supply chain traversal, with one array per field instead of one dictionary per node.
+
+    Nodes are identified by their position. Arrays:
+
+    * ``parent``: Position of the parent node, or -1 for the root (int64)
+    * ``level``: Depth in the supply chain graph (int32)
+    * ``ordinal``: Position among the inputs of the parent node, used for labels (int32)
+    * ``activity``: Activity index in ``activity_ids``, i.e. matrix column (int32)
+    * ``score``, ``amount``: Absolute score and input amount (float64)
+
+    String labels, metadata and a pandas ``DataFrame`` are only created on demand, with ``labels()``, ``metadata(field)`` and ``as_dataframe()``.
+
+    Args:
+        * *parent*, *level*, *ordinal*, *activity*, *score*, *amount* (arrays): See above.
+        * *activity_ids* (array): Node id for each activity index.
+        * *total_score* (float): Score of the whole supply chain, to calculate fractions.
+        * *root_label* (str, default=``root``): Label of the root node.
+
+    """
+
+    def __init__(
+        self,
+        parent,
+        level,
+        ordinal,
+        activity,
+        score,
+        amount,
+        activity_ids,
+        total_score,
+        root_label="root",
+    ):
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.level = np.asarray(level, dtype=np.int32)
+        self.ordinal = np.asarray(ordinal, dtype=np.int32)
+        self.activity = np.asarray(activity, dtype=np.int32)
+        self.score = np.asarray(score, dtype=np.float64)
+        self.amount = np.asarray(amount, dtype=np.float64)
+        self.activity_ids = activity_ids
+        self.total_score = total_score
+        self.root_label = root_label
+
+    @classmethod
+    def from_nodes(cls, nodes, activity_ids, total_score, root_label="root"):
+        """Build from an iterable of ``TraversalNode`` in an order where parents come before their inputs."""
+        columns = ([], [], [], [], [], [])
+        for node in nodes:
+            columns[0].append(-1 if node.parent is None else node.parent)
+            columns[1].append(node.level)
+            columns[2].append(node.ordinal)
+            columns[3].append(node.index)
+            columns[4].append(node.score)
+            columns[5].append(node.amount)
+        return cls(*columns, activity_ids, total_score, root_label)
+
+    def __len__(self):
+        return self.parent.shape[0]
+
+    @property
+    def fraction(self):
+        return self.score / self.total_score
+
+    @property
+    def ids(self):
+        """Node id of each node."""
+        return self.activity_ids[self.activity]
+
+    def children(self, position):
+        """Positions of the inputs of node ``position``."""
+        return np.flatnonzero(self.parent == position)
+
+    def labels(self):
+        """Return the string label of each node, as in ``recursive_calculation_to_object``."""
+        labels = []
+        for parent, ordinal in zip(self.parent.tolist(), self.ordinal.tolist()):
+            if parent < 0:
+                labels.append(self.root_label)
+            else:
+                labels.append(labels[parent] + "_" + alphabet_label(ordinal))
+        return labels
+
+    def metadata(self, field, default=None):
+        """Return the value of metadata ``field`` for each node, loaded in bulk."""
+        return [
+            data.get(field, default)
+            for data in resolver.get_many(self.ids, fields=[field])
+        ]
+
+    def as_dataframe(self):
+        """Return a ``DataFrame`` with the same columns as ``recursive_calculation_to_object(as_dataframe=True)``."""
+        labels = self.labels()
+        data = resolver.get_many(self.ids, fields=["name", "database", "code"])
+        return pd.DataFrame(
+            {
+                "label": labels,
+                "parent": [None if x < 0 else labels[x] for x in self.parent.tolist()],
+                "score": self.score,
+                "fraction": self.fraction,
+                "amount": self.amount,
+                "name": [x.get("name", "(Unknown name)") for x in data],
+                "key": [(x.get("database"), x.get("code")) for x in data],
+            }
+        )
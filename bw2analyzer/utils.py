@@ -1,96 +1,1032 @@
+import functools
 import itertools
+import json
+import math
+import multiprocessing
+import os
 import string
 import sys
+import time
+from collections import defaultdict
 from warnings import warn
 
-from bw2data import Database, databases, get_activity, methods
-from tqdm import tqdm
+from bw2data import databases, get_activity, labels, methods, projects
+from bw2data.backends import ActivityDataset
+from scipy import sparse
+from scipy.sparse import linalg as spla
 import bw2calc as bc
 import numpy as np
 import pandas as pd
 
+from .contribution import ContributionAnalysis, top_indices
+from .metadata import resolver
+from .progress import SweepMonitor, TqdmSink
+from .traversal import (
+    SupplyChainTree,
+    TechnosphereIndex,
+    alphabet_label,
+    best_first,
+    depth_first,
+    depth_first_order,
+    TextSink,
+    node_label,
+    unit_scores,
+    write_records,
+)
 
-def contribution_for_all_datasets_one_method(database, method, progress=True):
+
+def normalized_scores(lca, kind):
+    """Absolute contributions of ``activities``, ``flows``, or ``all`` matrix elements in ``lca.characterized_inventory``, normalized to sum to one."""
+    if kind == "activities":
+        data = lca.characterized_inventory.sum(axis=0)
+    elif kind == "flows":
+        data = lca.characterized_inventory.sum(axis=1)
+    elif kind == "all":
+        data = lca.characterized_inventory.data
+    scores = np.abs(np.array(data).ravel())
+    summed = scores.sum()
+    if summed == 0:
+        return np.zeros(scores.shape)
+    else:
+        return scores / summed
+
+
+def normalized_block_scores(characterized_biosphere, supply):
+    """Absolute contributions of ``activities``, ``flows``, and ``all`` matrix elements for a block of supply vectors, normalized to sum to one in each column.
+
+    Vectorized version of ``normalized_scores`` for many datasets at once. ``characterized_biosphere`` is the product of the characterization and biosphere matrices, as a COO matrix, and ``supply`` has one supply vector per column. ``all`` has one row per element of ``characterized_biosphere``, so needs ``characterized_biosphere.nnz * supply.shape[1]`` numbers.
+
+    Returns:
+        Tuple of (scores, normalized), where ``scores`` is the LCA score of each column, and ``normalized`` is a dictionary of 2-d arrays with keys ``activities``, ``flows``, and ``all``.
+
+    """
+    activities = (
+        np.asarray(characterized_biosphere.sum(axis=0)).ravel()[:, None] * supply
+    )
+    normalized = {
+        "activities": activities,
+        "flows": characterized_biosphere @ supply,
+        "all": characterized_biosphere.data[:, None]
+        * supply[characterized_biosphere.col, :],
+    }
+    for kind, values in normalized.items():
+        values = np.abs(values)
+        summed = values.sum(axis=0)
+        normalized[kind] = np.divide(
+            values, summed, out=np.zeros(values.shape), where=summed != 0
+        )
+    return activities.sum(axis=0), normalized
+
+
+# Smallest decade of ``tail_histogram`` bins; smaller values are counted in the first bin
+TAIL_MIN_EXPONENT = -12
+
+
+def tail_histogram(values, top, bins):
+    """Count the values which are not in ``top`` in ``bins`` logarithmic bins between ``10 ** TAIL_MIN_EXPONENT`` and one.
+
+    A fixed-size sketch of the distribution of the many small contributions which are not kept in a top-k selection; approximate quantiles of the tail can be read from its cumulative sum. Zeros are not counted.
+
+    Args:
+        * *values* (numpy array): Normalized values, 1-d or 2-d with one row per dataset.
+        * *top* (numpy array): Indices of kept values along the last axis, e.g. from ``top_indices``.
+        * *bins* (int): Number of bins.
+
+    Returns:
+        Array of counts with shape ``(rows, bins)``. Bin edges are ``tail_bin_edges(bins)``.
+
+    """
+    tail = np.atleast_2d(values).copy()
+    np.put_along_axis(tail, np.atleast_2d(top), 0, axis=1)
+    positive = tail > 0
+    exponents = np.log10(
+        tail, out=np.full(tail.shape, float(TAIL_MIN_EXPONENT)), where=positive
+    )
+    bin_index = np.clip(
+        ((exponents - TAIL_MIN_EXPONENT) / -TAIL_MIN_EXPONENT * bins).astype(int),
+        0,
+        bins - 1,
+    )
+    bin_index += np.arange(tail.shape[0]).reshape((-1, 1)) * bins
+    return np.bincount(bin_index[positive], minlength=tail.shape[0] * bins).reshape(
+        (-1, bins)
+    )
+
+
+def tail_bin_edges(bins):
+    """Bin edges of ``tail_histogram``."""
+    return np.logspace(TAIL_MIN_EXPONENT, 0, bins + 1)
+
+
+class DenseContributionResults:
+    """Store all normalized contributions of a database sweep in dense arrays.
+
+    Results of each dataset are calculated with ``extract``, which only needs the LCA object and ``options``, so that it can also run in a worker process. They are then added with ``insert``.
+
+    Only the largest ``all_limit`` elements of ``all`` are kept per dataset (default is four times the number of activities), selected with a partial sort, so memory use doesn't depend on the number of non-zero elements. With ``tail_bins``, the remaining elements are counted in a ``tail_histogram``, which is returned as ``tail``, with bin edges ``tail_edges``.
+    """
+
+    def __init__(
+        self, rows, cols, all_limit=None, tail_bins=None, filepath=None, mode="w+"
+    ):
+        self.all_cutoff = all_limit or cols * 4
+        self.tail_bins = tail_bins
+        shapes = {
+            "activities": (cols, cols),
+            "flows": (rows, cols),
+            "all": (self.all_cutoff, cols),
+        }
+        if tail_bins:
+            shapes["tail"] = (tail_bins, cols)
+        if filepath is None:
+            self.arrays = {
+                kind: np.zeros(shape, dtype=np.float32)
+                for kind, shape in shapes.items()
+            }
+        else:
+            # Memory-mapped ``.npy`` files, e.g. ``{filepath}.activities.npy``
+            self.arrays = {
+                kind: np.lib.format.open_memmap(
+                    "{}.{}.npy".format(filepath, kind),
+                    mode=mode,
+                    dtype=np.float32,
+                    shape=shape if mode == "w+" else None,
+                )
+                for kind, shape in shapes.items()
+            }
+        self.options = {"all_limit": self.all_cutoff, "tail_bins": tail_bins}
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def restore(self, previous, columns):
+        """Copy the arrays of ``previous`` results, except for ``columns``, which are set to zero."""
+        for kind, array in self.arrays.items():
+            if previous[kind].shape != array.shape:
+                raise ValueError(
+                    "Previous results for {} have shape {} instead of {}".format(
+                        kind, previous[kind].shape, array.shape
+                    )
+                )
+            array[:] = previous[kind]
+            array[:, columns] = 0
+
+    def flush(self):
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    @staticmethod
+    def extract(lca, all_limit, tail_bins=None):
+        results_all = normalized_scores(lca, "all")
+        top = top_indices(results_all, all_limit)
+        extracted = {
+            "activities": normalized_scores(lca, "activities"),
+            "flows": normalized_scores(lca, "flows"),
+            "all": results_all[top],
+        }
+        if tail_bins:
+            extracted["tail"] = tail_histogram(results_all, top, tail_bins)[0]
+        return extracted
+
+    @staticmethod
+    def extract_block(normalized, all_limit, tail_bins=None):
+        """Version of ``extract`` for the ``normalized`` results of ``normalized_block_scores``; returns a list with one result per column."""
+        results_all = normalized["all"].T
+        top = top_indices(results_all, all_limit)
+        top_values = np.take_along_axis(results_all, top, axis=1)
+        if tail_bins:
+            tails = tail_histogram(results_all, top, tail_bins)
+        extracted = []
+        for col in range(results_all.shape[0]):
+            extracted.append(
+                {
+                    "activities": normalized["activities"][:, col],
+                    "flows": normalized["flows"][:, col],
+                    "all": top_values[col],
+                }
+            )
+            if tail_bins:
+                extracted[-1]["tail"] = tails[col]
+        return extracted
+
+    def insert(self, col, extracted):
+        for kind, values in extracted.items():
+            if kind == "all":
+                self.arrays[kind][: values.shape[0], col] = values
+            else:
+                self.arrays[kind][:, col] = values
+
+    def finalize(self):
+        if self.tail_bins:
+            return dict(self.arrays, tail_edges=tail_bin_edges(self.tail_bins))
+        return self.arrays
+
+
+class SparseContributionResults:
+    """Store only the largest normalized contributions of each dataset of a database sweep, as sparse matrices.
+
+    Memory use grows with ``limit * datasets`` instead of with ``datasets ** 2``. ``limit`` and ``limit_type`` are passed to ``ContributionAnalysis.sort_array``; use e.g. ``limit=0.95, limit_type="cumulative"`` to keep the values which together make up 95% of each score. At most ``all_limit`` elements of ``all`` are kept per dataset (default is four times the number of activities).
+    """
+
+    def __init__(self, rows, cols, limit=25, limit_type="number", all_limit=None):
+        self.all_cutoff = all_limit or cols * 4
+        self.shapes = {
+            "activities": (cols, cols),
+            "flows": (rows, cols),
+            "all": (self.all_cutoff, cols),
+        }
+        self.options = {"limit": limit, "limit_type": limit_type}
+        self.elements = {kind: ([], [], []) for kind in self.shapes}
+        self.nbytes = 0
+
+    def restore(self, previous, columns):
+        """Keep the elements of ``previous`` results, except for those in ``columns``."""
+        for kind, shape in self.shapes.items():
+            if previous[kind].shape != shape:
+                raise ValueError(
+                    "Previous results for {} have shape {} instead of {}".format(
+                        kind, previous[kind].shape, shape
+                    )
+                )
+            matrix = previous[kind].tocoo()
+            mask = ~np.isin(matrix.col, columns)
+            rows, cols, data = self.elements[kind]
+            rows.append(matrix.row[mask].astype(np.int64))
+            cols.append(matrix.col[mask].astype(np.int64))
+            data.append(matrix.data[mask].astype(np.float32))
+            self.nbytes += rows[-1].nbytes + cols[-1].nbytes + data[-1].nbytes
+
+    @staticmethod
+    def _elements(kind, top):
+        # Skip zeros and the ``nan`` padding of 2-d ``sort_array`` results
+        mask = top[:, 0] > 0
+        if kind == "all":
+            # For ``all``, the row is the rank of the value
+            indices = np.arange(mask.sum())
+        else:
+            indices = top[mask, 1].astype(np.int64)
+        return indices, top[mask, 0].astype(np.float32)
+
+    @staticmethod
+    def extract(lca, limit=25, limit_type="number"):
+        """Return ``{kind: (indices, values)}`` of the largest contributions."""
+        return {
+            kind: SparseContributionResults._elements(
+                kind,
+                ContributionAnalysis().sort_array(
+                    normalized_scores(lca, kind), limit=limit, limit_type=limit_type
+                ),
+            )
+            for kind in ("activities", "flows", "all")
+        }
+
+    @staticmethod
+    def extract_block(normalized, limit=25, limit_type="number"):
+        """Version of ``extract`` for the ``normalized`` results of ``normalized_block_scores``; returns a list with one result per column."""
+        tops = {
+            kind: ContributionAnalysis().sort_array(
+                values.T, limit=limit, limit_type=limit_type
+            )
+            for kind, values in normalized.items()
+        }
+        return [
+            {
+                kind: SparseContributionResults._elements(kind, top[col])
+                for kind, top in tops.items()
+            }
+            for col in range(normalized["all"].shape[1])
+        ]
+
+    def insert(self, col, extracted):
+        for kind, (indices, values) in extracted.items():
+            if kind == "all":
+                indices, values = indices[: self.all_cutoff], values[: self.all_cutoff]
+            rows, cols, data = self.elements[kind]
+            rows.append(indices)
+            cols.append(np.full(indices.shape[0], col, dtype=np.int64))
+            data.append(values)
+            self.nbytes += indices.nbytes + cols[-1].nbytes + values.nbytes
+
+    def finalize(self):
+        results = {}
+        for kind, shape in self.shapes.items():
+            rows, cols, data = (
+                np.concatenate(x) if x else np.zeros(0) for x in self.elements[kind]
+            )
+            results[kind] = sparse.csc_matrix(
+                (data.astype(np.float32), (rows, cols)), shape=shape
+            )
+        return results
+
+
+class SweepCheckpoint:
+    """Keep the results of a dense database sweep in memory-mapped ``.npy`` files in ``dirpath``, so that an interrupted sweep can be resumed.
+
+    ``manifest.json`` has the database, methods and array shape of the sweep, and the list of completed columns. Columns are only added to the manifest after the arrays are flushed to disk, so a completed column is never lost. If ``dirpath`` already has a manifest for the same sweep, its arrays are reopened and completed columns are skipped; a manifest for a different sweep raises a ``ValueError``.
+
+    Args:
+        * *dirpath* (str): Directory for result arrays and manifest. Created if needed.
+        * *database* (str): Name of database
+        * *lcia_methods* (list): Method tuples
+        * *rows* (int): Number of biosphere flows
+        * *cols* (int): Number of activities
+        * *all_limit* (int, optional): See ``DenseContributionResults``
+        * *tail_bins* (int, optional): See ``DenseContributionResults``
+        * *interval* (int, default=100): Save the manifest after this many completed columns.
+
+    """
+
+    def __init__(
+        self,
+        dirpath,
+        database,
+        lcia_methods,
+        rows,
+        cols,
+        all_limit=None,
+        tail_bins=None,
+        interval=100,
+    ):
+        self.dirpath = dirpath
+        self.interval = interval
+        self.manifest_filepath = os.path.join(dirpath, "manifest.json")
+        self.manifest = {
+            "database": database,
+            "methods": [list(method) for method in lcia_methods],
+            "shape": [rows, cols],
+            "all_limit": all_limit or cols * 4,
+            "tail_bins": tail_bins,
+            "completed": [],
+        }
+        os.makedirs(dirpath, exist_ok=True)
+
+        mode = "w+"
+        if os.path.exists(self.manifest_filepath):
+            with open(self.manifest_filepath) as f:
+                previous = json.load(f)
+            for key in ("database", "methods", "shape", "all_limit", "tail_bins"):
+                if previous[key] != self.manifest[key]:
+                    raise ValueError(
+                        "Existing sweep in {} has different {}: {} instead of {}".format(
+                            dirpath, key, previous[key], self.manifest[key]
+                        )
+                    )
+            self.manifest["completed"] = previous["completed"]
+            mode = "r+"
+
+        self.completed = set(self.manifest["completed"])
+        self.results = [
+            DenseContributionResults(
+                rows,
+                cols,
+                all_limit=all_limit,
+                tail_bins=tail_bins,
+                filepath=os.path.join(dirpath, "method-{}".format(i)),
+                mode=mode,
+            )
+            for i in range(len(lcia_methods))
+        ]
+        self._pending = 0
+        if mode == "w+":
+            self.save()
+
+    def done(self, col):
+        """Mark column ``col`` as completed, and save every ``interval`` columns."""
+        self.completed.add(int(col))
+        self._pending += 1
+        if self._pending >= self.interval:
+            self.save()
+
+    def save(self):
+        """Flush the arrays, and then write the manifest."""
+        for store in self.results:
+            store.flush()
+        self.manifest["completed"] = sorted(self.completed)
+        # Write to a temporary file first so that the manifest is never half-written
+        temp_filepath = self.manifest_filepath + ".tmp"
+        with open(temp_filepath, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(temp_filepath, self.manifest_filepath)
+        self._pending = 0
+
+
+def supply_chain_dependents(technosphere_matrix, columns, products=None):
+    """Find all activities whose supply chains include any of the activities ``columns``.
+
+    Walks the technosphere graph upstream with sparse matrix-vector products, one per supply chain level, starting from ``columns``: each activity produces its reference product, and every activity with a non-zero input of this product depends on it. Only newly found activities are followed in each step. The reference product rows can be given in ``products`` (e.g. from ``lca.dicts.product``); where they are not given, the row with the largest absolute value in the column is used, so waste treatment activities with a negative reference product are found as well.
+
+    Args:
+        * *technosphere_matrix* (scipy sparse matrix): Technosphere matrix.
+        * *columns* (iterable): Column indices of activities.
+        * *products* (array, optional): Reference product row of each column, or -1 if unknown.
+
+    Returns:
+        Boolean numpy array with one element per column, including ``columns``.
+
+    """
+    matrix = sparse.csc_matrix(technosphere_matrix)
+    matrix.sum_duplicates()
+    rows, cols = matrix.shape
+    if products is None:
+        products = np.full(cols, -1, dtype=np.int64)
+    else:
+        products = np.array(products, dtype=np.int64)
+    for col in np.flatnonzero(products < 0):
+        start, end = matrix.indptr[col], matrix.indptr[col + 1]
+        if end > start:
+            products[col] = matrix.indices[
+                start + np.argmax(np.abs(matrix.data[start:end]))
+            ]
+    consumption = (matrix != 0).astype(np.int8).T.tocsr()
+
+    found = np.zeros(cols, dtype=bool)
+    frontier = np.zeros(cols, dtype=bool)
+    frontier[list(columns)] = True
+    while frontier.any():
+        found |= frontier
+        produced = np.zeros(rows, dtype=np.int8)
+        frontier_products = products[frontier]
+        produced[frontier_products[frontier_products >= 0]] = 1
+        frontier = ((consumption @ produced) > 0) & ~found
+    return found
+
+
+def _node_id(node):
+    """Node id of an id, ``(database, code)`` key, or ``Activity`` object."""
+    if isinstance(node, (int, np.integer)):
+        return int(node)
+    elif isinstance(node, tuple):
+        return get_activity(node).id
+    return node.id
+
+
+def _sweep_lca(demand, lcia_methods, factorize=True):
+    """Build an LCA object, and load the characterization matrix of each LCIA method. The technosphere matrix is factorized unless ``factorize`` is false, e.g. in block mode, which keeps its own factorization."""
+    lca = bc.LCA({demand: 1}, method=lcia_methods[0])
+    lca.lci(factorize=factorize)
+    lca.lcia()
+    characterization_matrices = [lca.characterization_matrix]
+    for method in lcia_methods[1:]:
+        lca.switch_method(method)
+        characterization_matrices.append(lca.characterization_matrix)
+    return lca, characterization_matrices
+
+
+def _sweep_columns(lca, ids, extract, characterization_matrices, timings):
+    """Calculate the inventory of one unit of each dataset in ``ids`` once, and apply each characterization matrix to it.
+
+    Yields ``(column, extracted)`` for each dataset, where ``extracted`` has ``extract(lca)`` for each method, or ``None`` if the score for that method is zero. Seconds spent in the ``solve``, ``lcia`` and ``extract`` phases are added to ``timings``.
+    """
+    clock = time.perf_counter
+    for id_ in ids:
+        start = clock()
+        lca.lci(demand={id_: 1})
+        timings["solve"] += clock() - start
+        extracted = []
+        for matrix in characterization_matrices:
+            start = clock()
+            lca.characterization_matrix = matrix
+            lca.lcia_calculation()
+            timings["lcia"] += clock() - start
+            start = clock()
+            extracted.append(extract(lca) if lca.score else None)
+            timings["extract"] += clock() - start
+        yield lca.dicts.activity[id_], extracted
+
+
+def _sweep_blocks(
+    lca, ids, extract_block, characterization_matrices, solver, block_size, timings
+):
+    """Block version of ``_sweep_columns``, which solves the inventories of ``block_size`` datasets at once.
+
+    ``solver`` is a ``scipy.sparse.linalg.SuperLU`` factorization of the technosphere matrix, which can solve for many demand vectors in one call. Contributions are calculated for the whole block with ``normalized_block_scores``, which is timed as ``lcia``.
+    """
+    clock = time.perf_counter
+    characterized_biosphere = [
+        (matrix @ lca.biosphere_matrix).tocoo() for matrix in characterization_matrices
+    ]
+    ids = list(ids)
+    for start in range(0, len(ids), block_size):
+        block = ids[start : start + block_size]
+        started = clock()
+        demand = np.zeros((lca.technosphere_matrix.shape[0], len(block)))
+        demand[[lca.dicts.product[id_] for id_ in block], np.arange(len(block))] = 1
+        supply = solver.solve(demand)
+        timings["solve"] += clock() - started
+        extracted = []
+        for matrix in characterized_biosphere:
+            started = clock()
+            scores, normalized = normalized_block_scores(matrix, supply)
+            timings["lcia"] += clock() - started
+            started = clock()
+            extracted.append(
+                [
+                    values if score else None
+                    for score, values in zip(scores, extract_block(normalized))
+                ]
+            )
+            timings["extract"] += clock() - started
+        for index, id_ in enumerate(block):
+            yield lca.dicts.activity[id_], [x[index] for x in extracted]
+
+
+def _sweep_state(lca, characterization_matrices, extract, block_size):
+    """Everything needed to calculate the contributions of a list of datasets, in this or in a worker process."""
+    state = {
+        "lca": lca,
+        "characterization_matrices": characterization_matrices,
+        "extract": extract,
+        "block_size": block_size,
+    }
+    if block_size:
+        state["solver"] = spla.splu(lca.technosphere_matrix.tocsc())
+    return state
+
+
+def _sweep_ids(state, ids, timings):
+    if state["block_size"]:
+        return _sweep_blocks(
+            state["lca"],
+            ids,
+            state["extract"],
+            state["characterization_matrices"],
+            state["solver"],
+            state["block_size"],
+            timings,
+        )
+    return _sweep_columns(
+        state["lca"],
+        ids,
+        state["extract"],
+        state["characterization_matrices"],
+        timings,
+    )
+
+
+# State of a worker process, see ``_init_sweep_worker``
+_sweep_worker = {}
+
+
+def _init_sweep_worker(project, lcia_methods, demand, extract, block_size):
+    """Build and factorize the LCA object of a worker process once."""
+    if projects.current != project:
+        projects.set_current(project)
+    lca, characterization_matrices = _sweep_lca(
+        demand, lcia_methods, factorize=not block_size
+    )
+    _sweep_worker.update(
+        _sweep_state(lca, characterization_matrices, extract, block_size)
+    )
+
+
+def _sweep_chunk(ids):
+    """Calculate a chunk of datasets in a worker process; returns results and phase timings."""
+    timings = defaultdict(float)
+    return list(_sweep_ids(_sweep_worker, ids, timings)), dict(timings)
+
+
+def contribution_for_all_datasets_one_method(
+    database,
+    method,
+    progress=True,
+    storage="dense",
+    limit=25,
+    limit_type="number",
+    processes=None,
+    chunk_size=None,
+    checkpoint_dir=None,
+    block_size=None,
+    all_limit=None,
+    tail_bins=None,
+    callbacks=None,
+    previous=None,
+    changed=None,
+):
     """Calculate contribution analysis (for technosphere processes) for all inventory datasets in one database for one LCIA method.
 
+    Results are stored for three kinds of contributions, each with one column per dataset (indexed by ``lca.dicts.activity``):
+
+    * ``activities``: Normalized absolute contributions by activity
+    * ``flows``: Normalized absolute contributions by biosphere flow
+    * ``all``: The largest ``all_limit`` normalized absolute contributions of the individual elements of the characterized inventory, sorted from highest to lowest
+
+    Each column sums to one (unless its LCA score is zero). With ``storage="dense"``, all values are stored in dense float32 arrays, which is only feasible for small databases. With ``storage="sparse"``, only the largest values of each column are kept (see ``SparseContributionResults``) and results are scipy sparse matrices.
+
+    With ``processes`` larger than one, datasets are split into chunks of ``chunk_size`` and calculated in a process pool. Each worker process builds and factorizes its own LCA object once. Chunk results are merged in dataset order, so results don't depend on the number of processes. Worker processes use the current project; with the ``spawn`` start method (the default on Windows and macOS), the project must be available from the default project directory.
+
+    To calculate contributions for several methods, use ``contribution_for_all_datasets_multiple_methods``, which only solves the inventory of each dataset once.
+
     Args:
         *database* (str): Name of database
         *method* (tuple): Method tuple
+        *progress* (bool): Show a progress bar
+        *storage* (str): ``dense`` or ``sparse``
+        *limit* (number): Number of values, or fraction of the score, to keep per dataset. Only used for sparse storage.
+        *limit_type* (str): ``number``, ``percent``, or ``cumulative``. Only used for sparse storage.
+        *processes* (int): Number of worker processes. Default is to calculate in this process.
+        *chunk_size* (int): Number of datasets per chunk. Default is to make four chunks per process.
+        *checkpoint_dir* (str): Directory to keep results in, as memory-mapped ``.npy`` files, so that an interrupted sweep can be resumed by calling this function again with the same arguments. See ``SweepCheckpoint``. Only for dense storage.
+        *block_size* (int): Solve the inventories of this many datasets at once (e.g. 256), and calculate their contributions with vectorized array operations. Needs memory for ``block_size`` times the number of biosphere matrix elements. Default is to calculate one dataset at a time.
+        *all_limit* (int): Number of elements to keep in ``all``. Default is four times the number of activities.
+        *tail_bins* (int): Also count the elements of ``all`` which are not kept in this many logarithmic bins, returned as ``tail`` and ``tail_edges`` (see ``tail_histogram``). Only for dense storage.
+        *callbacks* (list): Sinks which receive throughput and timing metrics after each dataset, e.g. ``LoggingSink`` or ``JSONMetricsSink`` from ``bw2analyzer.progress``. See ``SweepMonitor`` for the metrics. The phases are ``solve``, ``lcia``, ``extract`` (normalization and sorting), and ``store``.
+        *previous* (dict): Results of an earlier call of this function, to update incrementally.
+        *changed* (list): Activities which changed since ``previous``, as node ids, keys, or ``Activity`` objects.
+
+    After editing some activities, results can be updated incrementally by passing the ``previous`` results of this function and the ``changed`` activities. Only the datasets whose supply chains include a changed activity (see ``supply_chain_dependents``) are calculated again; the other columns are copied. All other arguments must be the same as for the previous results, and the matrix layout must not have changed, i.e. no activities were added or removed.
+
+    Datasets are found with one query for their ids, and calculated in the order of their matrix columns. No ``Activity`` objects or other metadata are loaded.
 
     Returns:
-        NumPy array of relative contributions. Each column sums to one.
-        Lookup dictionary, dataset keys to row/column indices
+        Dictionary of results arrays or sparse matrices, with keys ``activities``, ``flows``, and ``all``, and ``activity_ids``, an array of the node id of each column (i.e. ``lca.dicts.activity`` reversed).
 
     """
+    return contribution_for_all_datasets_multiple_methods(
+        database,
+        [method],
+        progress=progress,
+        storage=storage,
+        limit=limit,
+        limit_type=limit_type,
+        processes=processes,
+        chunk_size=chunk_size,
+        checkpoint_dir=checkpoint_dir,
+        block_size=block_size,
+        all_limit=all_limit,
+        tail_bins=tail_bins,
+        callbacks=callbacks,
+        previous=None if previous is None else {method: previous},
+        changed=changed,
+    )[method]
 
-    def get_normalized_scores(lca, kind):
-        if kind == "activities":
-            data = lca.characterized_inventory.sum(axis=0)
-        elif kind == "flows":
-            data = lca.characterized_inventory.sum(axis=1)
-        elif kind == "all":
-            data = lca.characterized_inventory.data
-        scores = np.abs(np.array(data).ravel())
-        summed = scores.sum()
-        if summed == 0:
-            return np.zeros(scores.shape)
-        else:
-            return scores / summed
 
-    assert database in databases, f"Can't find database {database}"
-    assert method in methods, f"Can't find method {method}"
-    db = Database(database)
-    assert len(db), f"Database {database} appears to have no datasets"
+def contribution_for_all_datasets_multiple_methods(
+    database,
+    lcia_methods,
+    progress=True,
+    storage="dense",
+    limit=25,
+    limit_type="number",
+    processes=None,
+    chunk_size=None,
+    checkpoint_dir=None,
+    block_size=None,
+    all_limit=None,
+    tail_bins=None,
+    callbacks=None,
+    previous=None,
+    changed=None,
+):
+    """Calculate contribution analysis for all inventory datasets in one database for several LCIA methods.
 
-    # Array to store results
-    results = np.zeros((len(db), len(db)), dtype=np.float32)
+    The inventory of each dataset doesn't depend on the LCIA method, so it is only solved once, and then multiplied by the characterization matrix of each method. All results are filled in the same pass.
 
-    # Instantiate LCA object
-    lca = bc.LCA({db.random(): 1}, method=method)
-    lca.lci()
-    lca.lcia()
+    Takes the same arguments as ``contribution_for_all_datasets_one_method``, except for ``lcia_methods``, a list of method tuples, and ``previous``, which is the return value of this function.
+
+    Returns:
+        Dictionary of ``{method: results}``, where ``results`` is the same as the return value of ``contribution_for_all_datasets_one_method``.
+
+    """
+    lcia_methods = list(lcia_methods)
+    assert database in databases, f"Can't find database {database}"
+    assert lcia_methods, "Must give at least one method"
+    for method in lcia_methods:
+        assert method in methods, f"Can't find method {method}"
+    if storage not in ("dense", "sparse"):
+        raise ValueError("storage must be either 'dense' or 'sparse'.")
+    if checkpoint_dir is not None and storage != "dense":
+        raise ValueError("Checkpoints are only possible with dense storage.")
+    if tail_bins and storage != "dense":
+        raise ValueError("Tail histograms are only possible with dense storage.")
+    if (previous is None) != (changed is None):
+        raise ValueError("Incremental updates need both `previous` and `changed`.")
+    if previous is not None and checkpoint_dir is not None:
+        raise ValueError("Incremental updates can't be combined with checkpoints.")
+    # Only load node ids, not full ``Activity`` objects
+    ids = [
+        id_
+        for (id_,) in ActivityDataset.select(ActivityDataset.id)
+        .where(
+            (ActivityDataset.database == database)
+            & (ActivityDataset.type << list(labels.process_node_types))
+        )
+        .tuples()
+    ]
+    assert ids, f"Database {database} appears to have no datasets"
+
+    # Instantiate LCA object; ``ids`` can be empty after filtering, so keep the demand for worker processes
+    demand = ids[0]
+    lca, characterization_matrices = _sweep_lca(
+        demand, lcia_methods, factorize=not block_size
+    )
+    # Calculate datasets in matrix column order
+    ids = sorted(
+        (id_ for id_ in ids if id_ in lca.dicts.activity),
+        key=lca.dicts.activity.__getitem__,
+    )
+    activity_ids = ContributionAnalysis().result_context(lca).ids("activity")
 
     rows = lca.characterized_inventory.shape[0]
     cols = lca.characterized_inventory.shape[1]
-    all_cutoff = cols * 4
 
-    results = {
-        "activities": np.zeros((cols, cols), dtype=np.float32),
-        "flows": np.zeros((rows, cols), dtype=np.float32),
-        "all": np.zeros((all_cutoff, cols), dtype=np.float32),
-    }
+    checkpoint = None
+    if checkpoint_dir is not None:
+        checkpoint = SweepCheckpoint(
+            checkpoint_dir, database, lcia_methods, rows, cols, all_limit, tail_bins
+        )
+        results = checkpoint.results
+        ids = [
+            id_ for id_ in ids if lca.dicts.activity[id_] not in checkpoint.completed
+        ]
+    elif storage == "dense":
+        results = [
+            DenseContributionResults(rows, cols, all_limit, tail_bins)
+            for _ in lcia_methods
+        ]
+    else:
+        results = [
+            SparseContributionResults(rows, cols, limit, limit_type, all_limit)
+            for _ in lcia_methods
+        ]
+    if previous is not None:
+        for method in lcia_methods:
+            if not np.array_equal(previous[method]["activity_ids"], activity_ids):
+                raise ValueError(
+                    "Matrix layout changed since previous results; run a full sweep"
+                )
+        changed_columns = [
+            lca.dicts.activity[_node_id(node)]
+            for node in changed
+            if _node_id(node) in lca.dicts.activity
+        ]
+        products = np.full(len(lca.dicts.activity), -1, dtype=np.int64)
+        for id_, col in lca.dicts.activity.items():
+            if id_ in lca.dicts.product:
+                products[col] = lca.dicts.product[id_]
+        recalculate = supply_chain_dependents(
+            lca.technosphere_matrix, changed_columns, products
+        )
+        ids = [id_ for id_ in ids if recalculate[lca.dicts.activity[id_]]]
+        for method, store in zip(lcia_methods, results):
+            store.restore(previous[method], np.flatnonzero(recalculate))
+    extract = functools.partial(
+        type(results[0]).extract_block if block_size else type(results[0]).extract,
+        **results[0].options,
+    )
+
+    sinks = list(callbacks or [])
+    if progress:
+        sinks.append(TqdmSink())
+    monitor = SweepMonitor(len(ids), sinks)
+
+    def insert(col, extracted):
+        with monitor.phase("store"):
+            for store, values in zip(results, extracted):
+                if values is not None:
+                    store.insert(col, values)
+            if checkpoint is not None:
+                checkpoint.done(col)
+        monitor.memory(sum(store.nbytes for store in results))
+        monitor.advance()
 
     # Actual calculations
-    for ds in tqdm(db):
-        lca.redo_lcia({ds.id: 1})
-        if not lca.score:
-            continue
+    if not processes or processes == 1:
+        state = _sweep_state(lca, characterization_matrices, extract, block_size)
+        timings = defaultdict(float)
+        for col, extracted in _sweep_ids(state, ids, timings):
+            monitor.add_timings(timings)
+            timings.clear()
+            insert(col, extracted)
+    elif ids:  # No pool needed if e.g. a finished checkpoint is resumed
+        del lca, characterization_matrices
+        chunk_size = chunk_size or max(1, math.ceil(len(ids) / (processes * 4)))
+        chunks = [ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+        with multiprocessing.Pool(
+            processes,
+            initializer=_init_sweep_worker,
+            initargs=(projects.current, lcia_methods, demand, extract, block_size),
+        ) as pool:
+            # ``imap`` returns chunks in order
+            for chunk_results, timings in pool.imap(_sweep_chunk, chunks):
+                monitor.add_timings(timings)
+                for col, extracted in chunk_results:
+                    insert(col, extracted)
 
-        col = lca.dicts.activity[ds.id]
-        results["activities"][:, col] = get_normalized_scores(lca, "activities")
-        results["flows"][:, col] = get_normalized_scores(lca, "flows")
-        results_all = get_normalized_scores(lca, "all")
-        results_all.sort()
-        results_all = results_all[::-1]
-        fill_number = results_all.shape[0]
-        assert fill_number < all_cutoff, "Too many values in 'all'"
-        results["all"][:fill_number, col] = results_all
+    if checkpoint is not None:
+        checkpoint.save()
+    monitor.close()
 
-    return results
+    return {
+        method: dict(store.finalize(), activity_ids=activity_ids)
+        for method, store in zip(lcia_methods, results)
+    }
+
+
+# Default ``max_level`` of the recursive calculation functions; see ``_max_level``
+_DEFAULT_MAX_LEVEL = object()
+
+
+def _max_level(max_level, max_nodes):
+    """Resolve the default ``max_level``: 3, or no limit if the number of nodes is limited by ``max_nodes``."""
+    if max_level is _DEFAULT_MAX_LEVEL:
+        return 3 if max_nodes is None else None
+    return max_level
+
+
+def _with_metadata(nodes, index, batch_size=100):
+    """Yield ``(node, metadata)`` for an iterable of ``TraversalNode``, resolving metadata in batches.
+
+    Each node is scored when it is taken from ``nodes``, so batches start with a single node and double up to ``batch_size`` nodes; the first record is yielded as soon as the root node is scored.
+    """
+    nodes = iter(nodes)
+    size = 1
+    for batch in iter(lambda: list(itertools.islice(nodes, size)), []):
+        yield from zip(
+            batch, resolver.get_many(index.activity_ids[[node.index for node in batch]])
+        )
+        size = min(size * 2, batch_size)
+
+
+def _matrix_nodes(
+    activity,
+    lcia_method,
+    amount,
+    max_level,
+    cutoff,
+    use_unit_scores,
+    max_nodes,
+    _lca_obj,
+    _total_score,
+    _unit_scores,
+):
+    """Set up a traversal of the supply chain of ``activity`` with a ``TechnosphereIndex``.
+
+    Returns ``(nodes, index, total_score)``, where ``nodes`` is an iterator of ``TraversalNode`` in depth-first tree order.
+    """
+    given = _lca_obj is not None
+    if not given:
+        _lca_obj = bc.LCA({activity: amount}, lcia_method)
+        _lca_obj.lci()
+        _lca_obj.lcia()
+        _total_score = _lca_obj.score
+    elif _total_score is None:
+        raise ValueError
+    lca = _lca_obj
+    index = TechnosphereIndex(lca)
+
+    if use_unit_scores:
+        if _unit_scores is None:
+            _unit_scores = unit_scores(lca)
+
+        def score(col, amount):
+            return float(amount * _unit_scores[index.product[col]])
+
+    else:
+
+        def score(col, amount):
+            lca.redo_lcia({int(index.activity_ids[col]): amount})
+            return lca.score
+
+    def keep(amount, score):
+        return abs(score) > abs(_total_score * cutoff)
+
+    root = lca.dicts.activity[activity.id]
+    if max_nodes is None:
+        nodes = depth_first(index, root, amount, max_level, score=score, keep=keep)
+    else:
+        nodes = iter(
+            depth_first_order(
+                list(
+                    best_first(
+                        index,
+                        root,
+                        amount,
+                        max_nodes,
+                        score,
+                        max_level=max_level,
+                        keep=keep,
+                    )
+                )
+            )
+        )
+
+    def checked(nodes):
+        for node in nodes:
+            # As in the recursive functions, a given LCA object means that
+            # the root is also checked against the cutoff
+            if node.parent is None and given and not keep(node.amount, node.score):
+                return
+            yield node
+
+    return checked(nodes), index, _total_score
+
+
+def iter_recursive_calculation(
+    activity,
+    lcia_method,
+    amount=1,
+    max_level=_DEFAULT_MAX_LEVEL,
+    cutoff=1e-2,
+    use_unit_scores=False,
+    max_nodes=None,
+    root_label="root",
+    _lca_obj=None,
+    _total_score=None,
+    _unit_scores=None,
+):
+    """Traverse a supply chain graph, and calculate the LCA scores of each component. Yields one record per node as it is calculated, so results can be streamed to a sink (see ``bw2analyzer.traversal.write_records``), and consumers can stop early.
+
+    Uses the ``matrix`` backend of ``recursive_calculation_to_object``: the graph is walked with a ``bw2analyzer.traversal.TechnosphereIndex``, and metadata is resolved in small batches. Memory use doesn't grow with the number of yielded nodes, except with ``max_nodes``, which needs all visited nodes to put them in tree order.
+
+    Records are dictionaries of the form:
+
+        {
+            'label': Label of this branch, as in ``recursive_calculation_to_object``
+            'parent': Label of the parent branch, or ``None`` for the root
+            'level': Depth in the supply chain graph
+            'score': Absolute score of this activity
+            'fraction': Fraction of total score of this activity
+            'amount': Input amount of the reference product of this activity
+            'name': Name of this activity
+            'key': Activity key
+            'id': Activity id
+            'activity': Activity description, as ``str(Activity)``
+        }
+
+    Args:
+        activity: ``Activity``. The starting point of the supply chain graph.
+        lcia_method: tuple. LCIA method to use when traversing supply chain graph.
+        amount: int. Amount of ``activity`` to assess.
+        max_level: int. Maximum depth to traverse. Default is 3, or no limit if ``max_nodes`` is given.
+        cutoff: float. Fraction of total score to use as cutoff when deciding whether to traverse deeper.
+        use_unit_scores: bool. See ``recursive_calculation_to_object``.
+        max_nodes: int. See ``recursive_calculation_to_object``.
+        root_label: str. Label of the root node.
+
+    Normally internal args:
+        _lca_obj: ``LCA``. Can give an instance of the LCA class (e.g. when doing regionalized or Monte Carlo LCA)
+        _total_score: float. Needed if specifying ``_lca_obj``.
+        _unit_scores: array. Result of ``unit_scores(_lca_obj)``; calculated if needed and not given.
+
+    """
+    activity = get_activity(activity)
+    max_level = _max_level(max_level, max_nodes)
+    nodes, index, _total_score = _matrix_nodes(
+        activity,
+        lcia_method,
+        amount,
+        max_level,
+        cutoff,
+        use_unit_scores,
+        max_nodes,
+        _lca_obj,
+        _total_score,
+        _unit_scores,
+    )
+
+    # Nodes are in depth-first order, so only the labels of the current
+    # branch are needed
+    labels = []
+    for node, data in _with_metadata(nodes, index):
+        if node.parent is None:
+            label, parent = root_label, None
+        else:
+            parent = labels[node.level - 1]
+            label = parent + "_" + alphabet_label(node.ordinal)
+        del labels[node.level :]
+        labels.append(label)
+        yield {
+            "label": label,
+            "parent": parent,
+            "level": node.level,
+            "score": node.score,
+            "fraction": node.score / _total_score,
+            "amount": float(node.amount),
+            "name": data.get("name", "(Unknown name)"),
+            "key": (data.get("database"), data.get("code")),
+            "id": int(index.activity_ids[node.index]),
+            "activity": node_label(data),
+        }
 
 
 def print_recursive_calculation(
     activity,
     lcia_method,
     amount=1,
-    max_level=3,
+    max_level=_DEFAULT_MAX_LEVEL,
     cutoff=1e-2,
     string_length=130,
     file_obj=None,
     tab_character="  ",
     use_matrix_values=False,
+    use_unit_scores=False,
+    backend="orm",
+    max_nodes=None,
     _lca_obj=None,
     _total_score=None,
+    _unit_scores=None,
     __level=0,
     __first=True,
 ):
@@ -102,16 +1038,20 @@ def print_recursive_calculation(
         activity: ``Activity``. The starting point of the supply chain graph.
         lcia_method: tuple. LCIA method to use when traversing supply chain graph.
         amount: int. Amount of ``activity`` to assess.
-        max_level: int. Maximum depth to traverse.
+        max_level: int. Maximum depth to traverse. Default is 3, or no limit if ``max_nodes`` is given.
         cutoff: float. Fraction of total score to use as cutoff when deciding whether to traverse deeper.
         string_length: int. Maximum length of printed string.
         file_obj: File-like object (supports ``.write``), optional. Output will be written to this object if provided.
         tab_character: str. Character to use to indicate indentation.
         use_matrix_values: bool. Take exchange values from the matrix instead of the exchange instance ``amount``. Useful for Monte Carlo, but can be incorrect if there is more than one exchange from the same pair of nodes.
+        use_unit_scores: bool. Calculate the score per unit of every product once (see ``bw2analyzer.traversal.unit_scores``), and get the score of each node as ``amount * unit score``, instead of solving the LCA for each node. Much faster for deep traversals, but not valid for LCA classes with a different score calculation, e.g. regionalized LCA.
+        backend: str. ``orm`` (default) to follow the exchanges of each activity in the database, or ``matrix`` to follow a ``bw2analyzer.traversal.TechnosphereIndex`` built from the technosphere matrix, with metadata only loaded for the printed nodes. Much faster, but takes exchange amounts from the matrix (see ``TechnosphereIndex``), and orders inputs by matrix index.
+        max_nodes: int. Traverse best first instead of depth first, and return (or print) the ``max_nodes`` nodes with the highest absolute scores, independent of their depth (see ``bw2analyzer.traversal.best_first``). ``cutoff`` and an explicit ``max_level`` still apply. Nodes are returned in tree order. Needs ``backend="matrix"``.
 
     Normally internal args:
         _lca_obj: ``LCA``. Can give an instance of the LCA class (e.g. when doing regionalized or Monte Carlo LCA)
         _total_score: float. Needed if specifying ``_lca_obj``.
+        _unit_scores: array. Result of ``unit_scores(_lca_obj)``; calculated if needed and not given.
 
     Internal args (used during recursion, do not touch);
         __level: int.
@@ -122,26 +1062,57 @@ def print_recursive_calculation(
 
     """
     activity = get_activity(activity)
+    max_level = _max_level(max_level, max_nodes)
     if file_obj is None:
         file_obj = sys.stdout
 
+    if backend == "matrix":
+        write_records(
+            iter_recursive_calculation(
+                activity,
+                lcia_method,
+                amount=amount,
+                max_level=max_level,
+                cutoff=cutoff,
+                use_unit_scores=use_unit_scores,
+                max_nodes=max_nodes,
+                _lca_obj=_lca_obj,
+                _total_score=_total_score,
+                _unit_scores=_unit_scores,
+            ),
+            TextSink(file_obj, string_length, tab_character),
+        )
+        return
+    elif backend != "orm":
+        raise ValueError("backend must be either 'orm' or 'matrix'.")
+    elif max_nodes is not None:
+        raise ValueError("max_nodes needs backend='matrix'.")
+
     if _lca_obj is None:
         _lca_obj = bc.LCA({activity: amount}, lcia_method)
         _lca_obj.lci()
         _lca_obj.lcia()
-        _total_score = _lca_obj.score
+        _total_score = score = _lca_obj.score
+        if use_unit_scores:
+            _unit_scores = unit_scores(_lca_obj)
     elif _total_score is None:
         raise ValueError
     else:
-        _lca_obj.redo_lcia({activity.id: amount})
-        if abs(_lca_obj.score) <= abs(_total_score * cutoff):
+        if use_unit_scores:
+            if _unit_scores is None:
+                _unit_scores = unit_scores(_lca_obj)
+            score = float(amount * _unit_scores[_lca_obj.dicts.product[activity.id]])
+        else:
+            _lca_obj.redo_lcia({activity.id: amount})
+            score = _lca_obj.score
+        if abs(score) <= abs(_total_score * cutoff):
             return
     if __first:
         file_obj.write("Fraction of score | Absolute score | Amount | Activity\n")
     message = "{}{:04.3g} | {:5.4n} | {:5.4n} | {}".format(
         tab_character * __level,
-        _lca_obj.score / _total_score,
-        _lca_obj.score,
+        score / _total_score,
+        score,
         float(amount),
         str(activity),
     )
@@ -189,8 +1160,10 @@ def print_recursive_calculation(
                 file_obj=file_obj,
                 tab_character=tab_character,
                 __first=False,
+                use_unit_scores=use_unit_scores,
                 _lca_obj=_lca_obj,
                 _total_score=_total_score,
+                _unit_scores=_unit_scores,
                 __level=__level + 1,
             )
 
@@ -203,6 +1176,7 @@ def print_recursive_supply_chain(
     string_length=130,
     file_obj=None,
     tab_character="  ",
+    backend="orm",
     __level=0,
 ):
     """Traverse a supply chain graph, and prints the inputs of each component.
@@ -219,6 +1193,7 @@ def print_recursive_supply_chain(
         string_length: int. Maximum length of each line.
         file_obj: File-like object (supports ``.write``), optional. Output will be written to this object if provided.
         tab_character: str. Character to use to indicate indentation.
+        backend: str. ``orm`` (default) to follow the exchanges of each activity in the database, or ``matrix`` to follow a ``bw2analyzer.traversal.TechnosphereIndex`` built from the technosphere matrix (loaded with ``LCA.load_lci_data``, without solving), with metadata only loaded for the printed nodes. Much faster, but takes exchange amounts from the matrix (see ``TechnosphereIndex``), and orders inputs by matrix index.
         __level: int. Current level of the calculation. Only used internally, do not touch.
 
     Returns:
@@ -231,6 +1206,28 @@ def print_recursive_supply_chain(
 
     if cutoff > 0 and amount < cutoff:
         return
+    if backend == "matrix":
+        lca = bc.LCA({activity: amount})
+        lca.load_lci_data()
+        index = TechnosphereIndex(lca)
+        nodes = list(
+            depth_first(
+                index,
+                lca.dicts.activity[activity.id],
+                amount,
+                max_level,
+                keep=lambda amount, _: not (cutoff > 0 and amount < cutoff),
+            )
+        )
+        metadata = resolver.get_many(index.activity_ids[[node.index for node in nodes]])
+        for node, data in zip(nodes, metadata):
+            message = "{}{:.3g}: {}".format(
+                tab_character * (__level + node.level), node.amount, node_label(data)
+            )
+            file_obj.write(message[:string_length] + "\n")
+        return
+    elif backend != "orm":
+        raise ValueError("backend must be either 'orm' or 'matrix'.")
     message = "{}{:.3g}: {}".format(tab_character * __level, amount, str(activity))
     file_obj.write(message[:string_length] + "\n")
     if __level < max_level:
@@ -273,13 +1270,18 @@ def recursive_calculation_to_object(
     activity,
     lcia_method,
     amount=1,
-    max_level=3,
+    max_level=_DEFAULT_MAX_LEVEL,
     cutoff=1e-2,
     as_dataframe=False,
     root_label="root",
+    columnar=False,
     use_matrix_values=False,
+    use_unit_scores=False,
+    backend="orm",
+    max_nodes=None,
     _lca_obj=None,
     _total_score=None,
+    _unit_scores=None,
     __result_list=None,
     __level=0,
     __label="",
@@ -301,10 +1303,14 @@ def recursive_calculation_to_object(
         activity: ``Activity``. The starting point of the supply chain graph.
         lcia_method: tuple. LCIA method to use when traversing supply chain graph.
         amount: int. Amount of ``activity`` to assess.
-        max_level: int. Maximum depth to traverse.
+        max_level: int. Maximum depth to traverse. Default is 3, or no limit if ``max_nodes`` is given.
         cutoff: float. Fraction of total score to use as cutoff when deciding whether to traverse deeper.
         as_dataframe: Return results as a list (default) or a pandas ``DataFrame``
         use_matrix_values: bool. Take exchange values from the matrix instead of the exchange instance ``amount``. Useful for Monte Carlo, but can be incorrect if there is more than one exchange from the same pair of nodes.
+        use_unit_scores: bool. Calculate the score per unit of every product once (see ``bw2analyzer.traversal.unit_scores``), and get the score of each node as ``amount * unit score``, instead of solving the LCA for each node. Much faster for deep traversals, but not valid for LCA classes with a different score calculation, e.g. regionalized LCA.
+        backend: str. ``orm`` (default) to follow the exchanges of each activity in the database, or ``matrix`` to follow a ``bw2analyzer.traversal.TechnosphereIndex`` built from the technosphere matrix, with metadata only loaded for the returned nodes. Much faster, but takes exchange amounts from the matrix (see ``TechnosphereIndex``), and orders inputs by matrix index.
+        max_nodes: int. Traverse best first instead of depth first, and return (or print) the ``max_nodes`` nodes with the highest absolute scores, independent of their depth (see ``bw2analyzer.traversal.best_first``). ``cutoff`` and an explicit ``max_level`` still apply. Nodes are returned in tree order. Needs ``backend="matrix"``.
+        columnar: bool. Return a compact ``bw2analyzer.traversal.SupplyChainTree`` with one array per field, instead of a list of dicts. Labels, metadata and a ``DataFrame`` are only created on demand. Needs ``backend="matrix"``.
 
     Internal args (used during recursion, do not touch):
         __result_list: list.
@@ -317,6 +1323,50 @@ def recursive_calculation_to_object(
 
     """
     activity = get_activity(activity)
+    max_level = _max_level(max_level, max_nodes)
+    if backend == "matrix" and columnar:
+        nodes, index, total_score = _matrix_nodes(
+            activity,
+            lcia_method,
+            amount,
+            max_level,
+            cutoff,
+            use_unit_scores,
+            max_nodes,
+            _lca_obj,
+            _total_score,
+            _unit_scores,
+        )
+        tree = SupplyChainTree.from_nodes(
+            nodes, index.activity_ids, total_score, root_label
+        )
+        return tree.as_dataframe() if as_dataframe else tree
+    elif backend == "matrix":
+        fields = ("label", "parent", "score", "fraction", "amount", "name", "key")
+        results = [
+            {field: record[field] for field in fields}
+            for record in iter_recursive_calculation(
+                activity,
+                lcia_method,
+                amount=amount,
+                max_level=max_level,
+                cutoff=cutoff,
+                use_unit_scores=use_unit_scores,
+                max_nodes=max_nodes,
+                root_label=root_label,
+                _lca_obj=_lca_obj,
+                _total_score=_total_score,
+                _unit_scores=_unit_scores,
+            )
+        ]
+        return pd.DataFrame(results) if as_dataframe else results
+    elif backend != "orm":
+        raise ValueError("backend must be either 'orm' or 'matrix'.")
+    elif max_nodes is not None:
+        raise ValueError("max_nodes needs backend='matrix'.")
+    elif columnar:
+        raise ValueError("columnar needs backend='matrix'.")
+
     if __result_list is None:
         __result_list = []
         __label = root_label
@@ -325,19 +1375,27 @@ def recursive_calculation_to_object(
         _lca_obj = bc.LCA({activity: amount}, lcia_method)
         _lca_obj.lci()
         _lca_obj.lcia()
-        _total_score = _lca_obj.score
+        _total_score = score = _lca_obj.score
+        if use_unit_scores:
+            _unit_scores = unit_scores(_lca_obj)
     elif _total_score is None:
         raise ValueError
     else:
-        _lca_obj.redo_lcia({activity.id: amount})
-        if abs(_lca_obj.score) <= abs(_total_score * cutoff):
+        if use_unit_scores:
+            if _unit_scores is None:
+                _unit_scores = unit_scores(_lca_obj)
+            score = float(amount * _unit_scores[_lca_obj.dicts.product[activity.id]])
+        else:
+            _lca_obj.redo_lcia({activity.id: amount})
+            score = _lca_obj.score
+        if abs(score) <= abs(_total_score * cutoff):
             return
     __result_list.append(
         {
             "label": __label,
             "parent": __parent,
-            "score": _lca_obj.score,
-            "fraction": _lca_obj.score / _total_score,
+            "score": score,
+            "fraction": score / _total_score,
             "amount": float(amount),
             "name": activity.get("name", "(Unknown name)"),
             "key": activity.key,
@@ -390,8 +1448,10 @@ def recursive_calculation_to_object(
                 __result_list=__result_list,
                 __parent=__label,
                 __label=__label + "_" + child_label if __label else child_label,
+                use_unit_scores=use_unit_scores,
                 _lca_obj=_lca_obj,
                 _total_score=_total_score,
+                _unit_scores=_unit_scores,
                 __level=__level + 1,
             )
 
@@ -1,7 +1,7 @@
 from .fixtures import lci_fixture, method_fixture
 from bw2analyzer.contribution import ContributionAnalysis as CA
 from bw2calc import LCA
-from bw2data import Method, Database
+from bw2data import Method, Database, get_activity
 from bw2data.tests import BW2DataTest
 from scipy import sparse
 import numpy as np
@@ -35,7 +35,7 @@ class ContributionTestCase(unittest.TestCase):
                 answer, ca.sort_array(test_data, limit=0.3, limit_type="percent")
             )
         )
-        
+
     def test_sort_array_percentage_negative(self):
         test_data = np.array((1.0, 2.0, -4.0, 3.0))
         answer = np.array(
@@ -60,6 +60,64 @@ class ContributionTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             ca.sort_array([], limit=1.01, limit_type="percent", total=1.0)
 
+    def test_sort_array_limit_larger_than_data(self):
+        test_data = np.array((1.0, -3.0, 2.0))
+        answer = np.array(((-3, 1), (2, 2), (1, 0)))
+        ca = CA()
+        self.assertTrue(np.allclose(answer, ca.sort_array(test_data, limit=10)))
+
+    def test_sort_array_2d_number(self):
+        test_data = np.array(((1.0, 2.0, 4.0, 3.0), (0.0, -5.0, 1.0, 0.0)))
+        answer = np.array((((4, 2), (3, 3)), ((-5, 1), (1, 2))))
+        ca = CA()
+        result = ca.sort_array(test_data, limit=2)
+        self.assertEqual(result.shape, (2, 2, 2))
+        self.assertTrue(np.allclose(answer, result))
+
+    def test_sort_array_2d_percentage(self):
+        test_data = np.array(((1.0, 2.0, 4.0, 3.0), (0.0, -5.0, 1.0, 0.0)))
+        ca = CA()
+        result = ca.sort_array(test_data, limit=0.3, limit_type="percent")
+        self.assertTrue(np.allclose(((4, 2), (3, 3)), result[0]))
+        self.assertTrue(np.allclose((-5, 1), result[1, 0]))
+        self.assertTrue(np.isnan(result[1, 1]).all())
+
+    def test_sort_array_cumulative(self):
+        test_data = np.array((1.0, 2.0, -4.0, 3.0, 0.0))
+        ca = CA()
+        self.assertTrue(
+            np.allclose(
+                ((-4, 2), (3, 3)),
+                ca.sort_array(test_data, limit=0.7, limit_type="cumulative"),
+            )
+        )
+        self.assertTrue(
+            np.allclose(
+                ((-4, 2),), ca.sort_array(test_data, limit=0.4, limit_type="cumulative")
+            )
+        )
+        # Zeros are never needed to reach the target
+        self.assertEqual(
+            ca.sort_array(test_data, limit=1, limit_type="cumulative").shape, (4, 2)
+        )
+        with self.assertRaises(ValueError):
+            ca.sort_array(test_data, limit=2, limit_type="cumulative")
+
+    def test_sort_array_cumulative_many_values(self):
+        # More values than the first partial selection
+        test_data = np.ones(1000)
+        test_data[500] = 100
+        result = CA().sort_array(test_data, limit=0.5, limit_type="cumulative")
+        self.assertEqual(result.shape, (451, 2))
+        self.assertEqual(result[0, 1], 500)
+
+    def test_sort_array_2d_cumulative(self):
+        test_data = np.array(((1.0, 2.0, 4.0, 3.0), (0.0, -5.0, 1.0, 0.0)))
+        result = CA().sort_array(test_data, limit=0.6, limit_type="cumulative")
+        self.assertTrue(np.allclose(((4, 2), (3, 3)), result[0]))
+        self.assertTrue(np.allclose((-5, 1), result[1, 0]))
+        self.assertTrue(np.isnan(result[1, 1]).all())
+
     def test_top_matrix_array(self):
         matrix = np.array([[0, 0, 1, 0], [2, 0, 4, 0], [3, 0, 1, 1], [0, 7, 0, 1]])
         ca = CA()
@@ -68,6 +126,14 @@ class ContributionTestCase(unittest.TestCase):
         self.assertTrue(np.allclose((1, 2), columns))
         self.assertEqual([(3, 1, 0, 0, 7), (1, 2, 1, 1, 4)], elements)
 
+    def test_top_matrix_cumulative(self):
+        matrix = np.array([[0, 0, 1, 0], [2, 0, 4, 0], [3, 0, 1, 1], [0, 7, 0, 1]])
+        elements, rows, columns = CA().top_matrix(
+            matrix, 0.5, 0.5, limit_type="cumulative"
+        )
+        self.assertTrue(np.allclose((3, 1), rows))
+        self.assertTrue(np.allclose((1, 2), columns))
+
     def test_top_matrix_matrix(self):
         matrix = sparse.lil_matrix((4, 4))
         input_data = [[0, 0, 1, 0], [2, 0, 4, 0], [3, 0, 1, 1], [0, 7, 0, 1]]
@@ -82,6 +148,20 @@ class ContributionTestCase(unittest.TestCase):
         self.assertTrue(np.allclose((1, 2), columns))
         self.assertEqual([(3, 1, 0, 0, 7), (1, 2, 1, 1, 4)], elements)
 
+    def test_top_matrix_arrays(self):
+        matrix = sparse.csc_matrix(
+            np.array([[0, 0, 1, 0], [2, 0, 4, 0], [3, 0, 1, 1], [0, 7, 0, 1]])
+        )
+        ca = CA()
+        (x, y, row, col, values), rows, columns = ca.top_matrix_arrays(matrix, 2, 2)
+        self.assertTrue(np.allclose((3, 1), rows))
+        self.assertTrue(np.allclose((1, 2), columns))
+        self.assertTrue(np.allclose((3, 1), x))
+        self.assertTrue(np.allclose((1, 2), y))
+        self.assertTrue(np.allclose((0, 1), row))
+        self.assertTrue(np.allclose((0, 1), col))
+        self.assertTrue(np.allclose((7, 4), values))
+
 
 class Contribution2TestCase(BW2DataTest):
     def install_fixtures(self):
@@ -113,3 +193,238 @@ class Contribution2TestCase(BW2DataTest):
             lca.dicts.biosphere.reversed,
             lca.dicts.activity.reversed,
         )
+
+    def test_d3_treemap_children(self):
+        self.install_fixtures()
+        lca = LCA({("a", "2"): 1}, ("method",))
+        lca.lci()
+        lca.lcia()
+        result = CA().d3_treemap(
+            lca.characterized_inventory,
+            lca.dicts.biosphere.reversed,
+            lca.dicts.activity.reversed,
+        )
+        self.assertAlmostEqual(result["size"], 3)
+        self.assertEqual(
+            [(child["name"], child["size"]) for child in result["children"]],
+            [("process 1", 2), ("process 2", 1)],
+        )
+        self.assertEqual(
+            result["children"][0]["children"], [{"name": "flow", "size": 2}]
+        )
+
+    def test_d3_treemap_reuses_marginal_sums(self):
+        self.install_fixtures()
+        lca = LCA({("a", "2"): 1}, ("method",))
+        lca.lci()
+        lca.lcia()
+        ca = CA()
+        sums = ca.result_context(lca).characterized
+        ca.d3_treemap(
+            lca.characterized_inventory,
+            lca.dicts.biosphere.reversed,
+            lca.dicts.activity.reversed,
+        )
+        # Processes were ranked with the cached sums, not with new ones
+        self.assertIn("sparse_col_sums", vars(sums))
+
+    def test_result_context_cached_and_invalidated(self):
+        self.install_fixtures()
+        lca = LCA({("a", "2"): 1}, ("method",))
+        lca.lci()
+        lca.lcia()
+        ca = CA()
+        sums = ca.result_context(lca).characterized
+        self.assertIs(sums, CA().result_context(lca).characterized)
+        self.assertIs(sums, ca.marginal_sums(lca.characterized_inventory))
+        self.assertAlmostEqual(sums.abs_total, 3)
+
+        lca.redo_lcia({get_activity(("a", "1")).id: 1})
+        new_sums = ca.result_context(lca).characterized
+        self.assertIsNot(sums, new_sums)
+        self.assertAlmostEqual(new_sums.abs_total, 2)
+
+    def test_annotated_top_emissions_inventory_amount(self):
+        self.install_fixtures()
+        lca = LCA({("a", "2"): 1}, ("method",))
+        lca.lci()
+        lca.lcia()
+        ((score, amount, flow),) = CA().annotated_top_emissions(lca)
+        self.assertAlmostEqual(score, 3)
+        self.assertAlmostEqual(amount, 3)
+        self.assertEqual(flow["name"], "flow")
+
+    def test_scenario_delta(self):
+        self.install_fixtures()
+        Database("s").write(
+            {
+                ("s", "1"): {
+                    "name": "scenario process",
+                    "exchanges": [
+                        {"input": ("c", "flow"), "type": "biosphere", "amount": 4}
+                    ],
+                }
+            }
+        )
+        baseline = LCA({("a", "2"): 1}, ("method",))
+        baseline.lci()
+        baseline.lcia()
+        scenario = LCA({("s", "1"): 1}, ("method",))
+        scenario.lci()
+        scenario.lcia()
+
+        result = CA().scenario_delta(baseline, scenario)
+        ids = lambda key: get_activity(key).id
+        self.assertEqual(
+            [(row[0], row[4]) for row in result["processes"]["absolute"]],
+            [(4, ids(("s", "1"))), (-2, ids(("a", "1"))), (-1, ids(("a", "2")))],
+        )
+        self.assertEqual(
+            [(row[1], row[4]) for row in result["processes"]["relative"]],
+            [(-1, ids(("a", "1"))), (-1, ids(("a", "2")))],
+        )
+        flows = result["flows"]["absolute"]
+        self.assertTrue(np.isnan(flows[0][1]))
+        self.assertEqual(
+            [row[:1] + row[2:] for row in flows],
+            [(4, 0, 4, ids(("c", "flow"))), (-3, 3, 0, ids(("a", "flow")))],
+        )
+        self.assertEqual(flows[1][1], -1)
+        self.assertEqual(result["delta"].shape, (2, 3))
+        self.assertTrue(sparse.issparse(result["delta"]))
+
+    def test_annotated_top_processes_columnar(self):
+        self.install_fixtures()
+        lca = LCA({("a", "2"): 1}, ("method",))
+        lca.lci()
+        lca.lcia()
+        result = CA().annotated_top_processes(lca, columnar=True)
+        self.assertIsNone(result._nodes)
+        self.assertEqual(len(result), 2)
+        self.assertTrue(np.allclose(result.score, (2, 1)))
+        self.assertTrue(np.allclose(result.amount, (1, 1)))
+        self.assertEqual(
+            result.ids.tolist(),
+            [get_activity(("a", "1")).id, get_activity(("a", "2")).id],
+        )
+        self.assertEqual(result.name.tolist(), ["process 1", "process 2"])
+        self.assertEqual(result.keys.tolist(), [("a", "1"), ("a", "2")])
+        df = result.as_dataframe()
+        self.assertEqual(
+            list(df.columns),
+            ["score", "amount", "index", "id", "name", "location", "unit"],
+        )
+
+    def test_annotated_top_emissions_columnar(self):
+        self.install_fixtures()
+        lca = LCA({("a", "2"): 1}, ("method",))
+        lca.lci()
+        lca.lcia()
+        result = CA().annotated_top_emissions(lca, columnar=True)
+        self.assertTrue(np.allclose(result.score, (3,)))
+        self.assertTrue(np.allclose(result.amount, (3,)))
+        self.assertEqual(result.name.tolist(), ["flow"])
+
+    def test_grouped_contributions(self):
+        self.install_fixtures()
+        lca = LCA({("a", "2"): 1}, ("method",))
+        lca.lci()
+        lca.lcia()
+        ca = CA()
+        self.assertEqual(
+            ca.grouped_contributions(lca, "name"), [(2, "process 1"), (1, "process 2")]
+        )
+        self.assertEqual(ca.grouped_contributions(lca, "database"), [(3, "a")])
+        self.assertEqual(ca.grouped_contributions(lca, "location"), [(3, "Unknown")])
+        self.assertEqual(
+            ca.grouped_contributions(lca, "name", kind="flows"), [(3, "flow")]
+        )
+        self.assertEqual(
+            ca.grouped_contributions(lca, lambda data: data["name"][-1]),
+            [(2, "1"), (1, "2")],
+        )
+        self.assertIs(
+            ca.group_indicator(lca, "name"), CA().group_indicator(lca, "name")
+        )
+        # Functions are not cached
+        ca.group_indicator(lca, lambda data: data["name"])
+        self.assertFalse(
+            any(callable(key[1]) for key in ca.result_context(lca).indicators)
+        )
+
+    def test_grouped_matrix(self):
+        self.install_fixtures()
+        lca = LCA({("a", "2"): 1}, ("method",))
+        lca.lci()
+        lca.lcia()
+        matrix, labels = CA().grouped_matrix(lca, "database")
+        self.assertEqual(labels, ["a"])
+        self.assertEqual(matrix.shape, (1, 1))
+        self.assertTrue(np.allclose(matrix.toarray(), 3))
+        matrix, labels = CA().grouped_matrix(lca, "name", kind="flows")
+        self.assertEqual(matrix.shape, (1, 2))
+        with self.assertRaises(ValueError):
+            CA().grouped_matrix(lca, "name", kind="foo")
+
+
+class SparseContributionTestCase(unittest.TestCase):
+    def test_sort_array_sparse_vector(self):
+        data = sparse.csr_matrix(np.array([[0.0, 0.0, 2.0, 0.0, -7.0, 1.0]]))
+        answer = np.array(((-7, 4), (2, 2), (1, 5)))
+        ca = CA()
+        self.assertTrue(np.allclose(answer, ca.sort_array(data, limit=10)))
+        self.assertTrue(np.allclose(answer[:2], ca.sort_array(data.T, limit=2)))
+        self.assertTrue(
+            np.allclose(
+                answer[:1], ca.sort_array(data, limit=0.5, limit_type="percent")
+            )
+        )
+
+    def test_sort_array_sparse_matrix(self):
+        data = sparse.csr_matrix(
+            np.array(
+                [[1.0, 0.0, -4.0, 3.0], [0.0, 0.0, 0.0, 0.0], [0.0, 5.0, 0.0, 0.0]]
+            )
+        )
+        result = CA().sort_array(data, limit=3)
+        self.assertEqual(result.shape, (3, 3, 2))
+        self.assertTrue(np.allclose(((-4, 2), (3, 3), (1, 0)), result[0]))
+        self.assertTrue(np.isnan(result[1]).all())
+        self.assertTrue(np.allclose((5, 1), result[2, 0]))
+        self.assertTrue(np.isnan(result[2, 1:]).all())
+
+    def test_sort_array_sparse_matrix_dense_row(self):
+        # One dense row doesn't make the other rows as wide
+        rng = np.random.default_rng(42)
+        dense = np.zeros((200, 50))
+        dense[np.arange(200), rng.integers(0, 50, size=200)] = rng.normal(size=200)
+        dense[7] = rng.normal(size=50)
+        data = sparse.csr_matrix(dense)
+        ca = CA()
+        for limit, limit_type in (
+            (3, "number"),
+            (0.1, "percent"),
+            (0.5, "cumulative"),
+        ):
+            expected = ca.sort_array(dense, limit=limit, limit_type=limit_type)
+            result = ca.sort_array(data, limit=limit, limit_type=limit_type)
+            # Only as wide as the row with the most selected values
+            self.assertEqual(
+                result.shape[:2], (200, (~np.isnan(result[..., 1])).sum(axis=1).max())
+            )
+            for row in range(200):
+                found = ~np.isnan(result[row, :, 1])
+                wanted = expected[row][~np.isnan(expected[row, :, 1])]
+                wanted = wanted[wanted[:, 0] != 0]
+                self.assertTrue(np.allclose(wanted, result[row][found]))
+
+    def test_top_processes_sparse(self):
+        matrix = sparse.csc_matrix(
+            np.array([[0.0, 1.0, 0.0, 0.0], [0.0, 2.0, 0.0, -6.0]])
+        )
+        ca = CA()
+        self.assertTrue(
+            np.allclose(((-6, 3), (3, 1)), ca.top_processes(matrix, limit=25))
+        )
+        self.assertTrue(np.allclose(((-4, 1),), ca.top_emissions(matrix, limit=1)))
+        self.assertEqual(ca.marginal_sums(matrix).sparse_col_sums.nnz, 2)
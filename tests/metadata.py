@@ -0,0 +1,53 @@
+from bw2analyzer.metadata import MetadataResolver
+from bw2data import Database, get_activity
+from bw2data.tests import bw2test
+
+from .fixtures import lci_fixture
+
+
+@bw2test
+def test_resolver_ids_and_keys():
+    Database("a").write(lci_fixture)
+    resolver = MetadataResolver()
+    id_ = get_activity(("a", "1")).id
+    first, second, missing = resolver.get_many([id_, ("a", "2"), ("a", "nope")])
+    assert first["name"] == "process 1"
+    assert first["id"] == id_
+    assert second["name"] == "process 2"
+    assert second["database"] == "a"
+    assert missing == {}
+    assert resolver.get(("a", "1"), "name") == "process 1"
+    assert resolver.names([("a", "1"), 12345]) == ["process 1", "Unknown"]
+    assert resolver.get_many([id_], fields=["name", "foo"]) == [{"name": "process 1"}]
+
+
+@bw2test
+def test_resolver_cache():
+    Database("a").write(lci_fixture)
+    resolver = MetadataResolver()
+    data = resolver.get(("a", "1"))
+    assert resolver.get(("a", "1")) is data
+    assert resolver.get(data["id"]) is data
+
+
+@bw2test
+def test_resolver_invalidated_on_database_change():
+    Database("a").write(lci_fixture)
+    resolver = MetadataResolver()
+    assert resolver.get(("a", "1"), "name") == "process 1"
+    act = get_activity(("a", "1"))
+    act["name"] = "changed"
+    act.save()
+    assert resolver.get(("a", "1"), "name") == "changed"
+
+
+@bw2test
+def test_resolver_lru_eviction():
+    Database("a").write(lci_fixture)
+    resolver = MetadataResolver(maxsize=2)
+    resolver.get_many([("a", "1"), ("a", "2")])
+    resolver.get(("a", "1"))
+    resolver.get(("a", "flow"))
+    assert len(resolver._cache) == 2
+    assert get_activity(("a", "2")).id not in resolver._cache
+    assert resolver.get(("a", "2"), "name") == "process 2"
@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+import tempfile
+
+from bw2analyzer.progress import JSONMetricsSink, LoggingSink, SweepMonitor
+
+
+class ListSink:
+    def __init__(self):
+        self.updates = []
+        self.closed = None
+
+    def update(self, metrics):
+        self.updates.append(metrics)
+
+    def close(self, metrics):
+        self.closed = metrics
+
+
+def test_sweep_monitor_metrics():
+    sink = ListSink()
+    monitor = SweepMonitor(4, [sink])
+    assert monitor.metrics()["eta"] is None
+    with monitor.phase("solve"):
+        pass
+    monitor.add_timings({"solve": 1.0, "lcia": 0.5})
+    monitor.memory(100)
+    monitor.memory(50)
+    monitor.advance()
+    monitor.advance(2)
+    metrics = monitor.close()
+    assert [m["completed"] for m in sink.updates] == [1, 3]
+    assert sink.closed == metrics
+    assert metrics["total"] == 4
+    assert metrics["phases"]["solve"] >= 1.0
+    assert metrics["phases"]["lcia"] == 0.5
+    assert metrics["peak_memory"] == 100
+    assert metrics["rate"] > 0
+    assert metrics["eta"] >= 0
+
+
+def test_json_metrics_sink():
+    with tempfile.TemporaryDirectory() as dirpath:
+        filepath = os.path.join(dirpath, "metrics.json")
+        monitor = SweepMonitor(2, [JSONMetricsSink(filepath, interval=3600)])
+        monitor.advance()
+        with open(filepath) as f:
+            assert json.load(f)["completed"] == 1
+        # Throttled until closed
+        monitor.advance()
+        with open(filepath) as f:
+            assert json.load(f)["completed"] == 1
+        monitor.close()
+        with open(filepath) as f:
+            assert json.load(f)["completed"] == 2
+        assert os.listdir(dirpath) == ["metrics.json"]
+
+
+def test_logging_sink(caplog):
+    monitor = SweepMonitor(1, [LoggingSink(interval=0)])
+    with caplog.at_level(logging.INFO, logger="bw2analyzer.progress"):
+        monitor.advance()
+    assert "1/1 datasets" in caplog.text
+    assert caplog.records[0].metrics["completed"] == 1
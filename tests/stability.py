@@ -0,0 +1,49 @@
+from bw2analyzer import ContributionStability
+from scipy import sparse
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_contribution_stability_statistics():
+    stability = ContributionStability(limit=2)
+    stability.add(np.array([[1.0, 3.0, 2.0], [0.0, 0.0, 0.0]]))
+    stability.add(sparse.csc_matrix(np.array([[3.0, 1.0, 2.0], [0.0, 0.0, 0.0]])))
+    results = stability.finalize()
+    assert np.allclose(results["mean"], (2, 2, 2))
+    assert np.allclose(results["variance"], (2, 2, 0))
+    assert np.allclose(results["top_frequency"], (0.5, 0.5, 1))
+    assert np.allclose(results["rank_frequency"], ((0.5, 0), (0.5, 0), (0, 1)))
+
+
+def test_contribution_stability_flows():
+    stability = ContributionStability(limit=1, kind="flows")
+    stability.add(np.array([[1.0, 1.0], [0.0, -5.0]]))
+    assert np.allclose(stability.finalize()["top_frequency"], (0, 1))
+
+
+def test_contribution_stability_dataframe():
+    stability = ContributionStability(limit=2)
+    stability.add(np.array([[1.0, 3.0, 2.0]]))
+    df = stability.finalize(as_dataframe=True)
+    assert isinstance(df, pd.DataFrame)
+    assert list(df.index) == [1, 2, 0]
+    assert list(df.columns) == [
+        "mean",
+        "variance",
+        "std",
+        "top_frequency",
+        "rank_0",
+        "rank_1",
+    ]
+    assert df["variance"].isna().all()
+
+
+def test_contribution_stability_errors():
+    with pytest.raises(ValueError):
+        ContributionStability(kind="foo")
+    stability = ContributionStability(size=2)
+    with pytest.raises(ValueError):
+        stability.finalize()
+    with pytest.raises(ValueError):
+        stability.add(np.ones((1, 3)))
@@ -0,0 +1,100 @@
+import itertools
+
+import bw2calc as bc
+import bw2data as bd
+import numpy as np
+from bw2data.tests import bw2test
+
+from bw2analyzer.traversal import (
+    TechnosphereIndex,
+    alphabet_label,
+    best_first,
+    depth_first,
+    depth_first_order,
+    unit_scores,
+)
+
+from .fixtures import recursive_fixture
+
+
+@bw2test
+def test_unit_scores():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    lca = bc.LCA({("a", "1"): 1}, ("method",))
+    lca.lci()
+    lca.lcia()
+    scores = unit_scores(lca)
+    assert scores.shape == (len(lca.dicts.product),)
+    for code in "12345":
+        id_ = bd.get_activity(("a", code)).id
+        lca.redo_lcia({id_: 2})
+        assert np.allclose(2 * scores[lca.dicts.product[id_]], lca.score)
+
+
+@bw2test
+def test_technosphere_index_depth_first():
+    bd.Database("a").write(recursive_fixture)
+    lca = bc.LCA({("a", "1"): 1})
+    lca.load_lci_data()
+    index = TechnosphereIndex(lca)
+    col = {
+        code: lca.dicts.activity[bd.get_activity(("a", code)).id] for code in "12345"
+    }
+    children, amounts = index.children(col["3"])
+    amounts = dict(zip(children.tolist(), amounts.tolist()))
+    assert set(amounts) == {col["4"], col["5"]}
+    assert np.allclose(amounts[col["4"]], 10)
+    assert np.allclose(amounts[col["5"]], 0.1)
+
+    nodes = list(depth_first(index, col["1"], 2, max_level=2))
+    assert [node.level for node in nodes] == [0, 1, 2]
+    assert [node.index for node in nodes] == [col["1"], col["2"], col["3"]]
+    assert nodes[0].parent is None and nodes[2].parent == 1
+    assert np.allclose(nodes[2].amount, 2 * 0.8 * 0.6)
+
+    nodes = list(
+        depth_first(
+            index, col["1"], 1, max_level=10, keep=lambda amount, _: amount > 0.5
+        )
+    )
+    assert [node.index for node in nodes] == [col["1"], col["2"]]
+
+
+@bw2test
+def test_best_first():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    lca = bc.LCA({("a", "1"): 1}, ("method",))
+    lca.lci()
+    lca.lcia()
+    index = TechnosphereIndex(lca)
+    scores = unit_scores(lca)
+
+    def score(col, amount):
+        return amount * scores[index.product[col]]
+
+    root = lca.dicts.activity[bd.get_activity(("a", "1")).id]
+    everything = list(depth_first(index, root, 1, max_level=6, score=score))
+    nodes = list(best_first(index, root, 1, 5, score, max_level=6))
+    assert len(nodes) == 5
+    assert [abs(node.score) for node in nodes] == sorted(
+        (abs(node.score) for node in nodes), reverse=True
+    )
+    assert np.allclose(
+        sorted(abs(node.score) for node in nodes),
+        sorted(abs(node.score) for node in everything)[-5:],
+    )
+    assert all(node.parent is None or node.parent < i for i, node in enumerate(nodes))
+
+    ordered = depth_first_order(nodes)
+    assert ordered[0] == nodes[0]
+    for node in ordered[1:]:
+        assert ordered[node.parent].level == node.level - 1
+
+
+def test_alphabet_label():
+    from bw2analyzer.utils import infinite_alphabet
+
+    expected = list(itertools.islice(infinite_alphabet(), 800))
+    assert [alphabet_label(n) for n in range(800)] == expected
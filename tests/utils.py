@@ -1,15 +1,37 @@
 import io
+import json
+import os
+import tempfile
 
 import bw2calc as bc
 import bw2data as bd
+import numpy as np
 import pandas as pd
 import pytest
 from bw2data.tests import bw2test
-
+from scipy import sparse
+
+from bw2analyzer.contribution import top_indices
+from bw2analyzer.progress import JSONMetricsSink
+from bw2analyzer.traversal import (
+    CSVSink,
+    DataFrameSink,
+    JSONLinesSink,
+    TechnosphereIndex,
+    depth_first,
+    write_records,
+)
 from bw2analyzer.utils import (
+    _with_metadata,
+    contribution_for_all_datasets_multiple_methods,
+    contribution_for_all_datasets_one_method,
+    iter_recursive_calculation,
     print_recursive_calculation,
     print_recursive_supply_chain,
     recursive_calculation_to_object,
+    supply_chain_dependents,
+    tail_bin_edges,
+    tail_histogram,
 )
 
 from .fixtures import method_fixture, recursive_fixture
@@ -755,3 +777,526 @@ def test_recursive_calculation_to_object_nonunitary_production_multiple_producti
     with pytest.warns(UserWarning, match="Hit multiple production exchanges"):
         result = recursive_calculation_to_object(("f", "1"), ("m",))
     assert result is None
+
+
+def sweep_fixture():
+    bd.Database("b").write({("b", "flow"): {"type": "emission", "name": "flow"}})
+    bd.Database("p").write(
+        {
+            ("p", "1"): {
+                "name": "1",
+                "exchanges": [
+                    {"input": ("b", "flow"), "amount": 2, "type": "biosphere"}
+                ],
+            },
+            ("p", "2"): {
+                "name": "2",
+                "exchanges": [
+                    {"input": ("b", "flow"), "amount": 1, "type": "biosphere"},
+                    {"input": ("p", "1"), "amount": 1, "type": "technosphere"},
+                ],
+            },
+            ("p", "3"): {"name": "3", "exchanges": []},
+        }
+    )
+    bd.Method(("m",)).write([(("b", "flow"), 1)])
+    lca = bc.LCA({bd.get_activity(("p", "1")): 1}, ("m",))
+    lca.lci()
+    return {
+        code: lca.dicts.activity[bd.get_activity(("p", code)).id]
+        for code in ("1", "2", "3")
+    }
+
+
+@bw2test
+def test_contribution_for_all_datasets_one_method():
+    cols = sweep_fixture()
+    results = contribution_for_all_datasets_one_method("p", ("m",))
+    assert results["activities"].shape == (3, 3)
+    assert results["flows"].shape == (1, 3)
+    assert results["all"].shape == (12, 3)
+    assert np.allclose(results["activities"][cols["1"], cols["1"]], 1)
+    assert np.allclose(results["activities"][cols["1"], cols["2"]], 2 / 3)
+    assert np.allclose(results["activities"][cols["2"], cols["2"]], 1 / 3)
+    assert not results["activities"][:, cols["3"]].any()
+    assert np.allclose(results["flows"][0, [cols["1"], cols["2"]]], 1)
+    assert np.allclose(results["all"][:2, cols["2"]], (2 / 3, 1 / 3))
+    assert results["activity_ids"].dtype == np.int64
+    assert results["activity_ids"][cols["2"]] == bd.get_activity(("p", "2")).id
+
+
+@bw2test
+def test_contribution_for_all_datasets_one_method_sparse():
+    cols = sweep_fixture()
+    results = contribution_for_all_datasets_one_method(
+        "p", ("m",), storage="sparse", limit=1
+    )
+    assert all(
+        sparse.issparse(results[kind]) for kind in ("activities", "flows", "all")
+    )
+    assert results["activities"].shape == (3, 3)
+    assert results["activities"].nnz == 2
+    assert np.allclose(results["activities"][cols["1"], cols["2"]], 2 / 3)
+    assert results["all"].nnz == 2
+    assert np.allclose(results["all"][0, cols["2"]], 2 / 3)
+
+    results = contribution_for_all_datasets_one_method(
+        "p", ("m",), storage="sparse", limit=0.9, limit_type="cumulative"
+    )
+    assert results["activities"][:, cols["2"]].nnz == 2
+    with pytest.raises(ValueError):
+        contribution_for_all_datasets_one_method("p", ("m",), storage="foo")
+
+
+@bw2test
+def test_contribution_for_all_datasets_one_method_parallel():
+    sweep_fixture()
+    serial = contribution_for_all_datasets_one_method("p", ("m",))
+    parallel = contribution_for_all_datasets_one_method(
+        "p", ("m",), processes=2, chunk_size=1
+    )
+    for kind in ("activities", "flows", "all"):
+        assert np.allclose(serial[kind], parallel[kind])
+
+    serial = contribution_for_all_datasets_one_method("p", ("m",), storage="sparse")
+    parallel = contribution_for_all_datasets_one_method(
+        "p", ("m",), storage="sparse", processes=2
+    )
+    for kind in ("activities", "flows", "all"):
+        assert np.allclose(serial[kind].toarray(), parallel[kind].toarray())
+
+
+@bw2test
+def test_contribution_for_all_datasets_multiple_methods():
+    cols = sweep_fixture()
+    bd.Method(("n",)).write([(("b", "flow"), -5)])
+    results = contribution_for_all_datasets_multiple_methods("p", [("m",), ("n",)])
+    assert set(results) == {("m",), ("n",)}
+    single = contribution_for_all_datasets_one_method("p", ("n",))
+    for kind in ("activities", "flows", "all"):
+        assert np.allclose(results[("m",)][kind], results[("n",)][kind])
+        assert np.allclose(results[("n",)][kind], single[kind])
+    assert np.allclose(results[("n",)]["activities"][cols["1"], cols["2"]], 2 / 3)
+
+
+@bw2test
+def test_contribution_for_all_datasets_one_method_checkpoint():
+    cols = sweep_fixture()
+    expected = contribution_for_all_datasets_one_method("p", ("m",))
+    with tempfile.TemporaryDirectory() as dirpath:
+        results = contribution_for_all_datasets_one_method(
+            "p", ("m",), checkpoint_dir=dirpath
+        )
+        for kind in ("activities", "flows", "all"):
+            assert np.allclose(results[kind], expected[kind])
+        with open(os.path.join(dirpath, "manifest.json")) as f:
+            manifest = json.load(f)
+        assert manifest["completed"] == [0, 1, 2]
+        del results
+
+        # Simulate a sweep interrupted before dataset "2"
+        manifest["completed"].remove(cols["2"])
+        with open(os.path.join(dirpath, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        activities = np.load(os.path.join(dirpath, "method-0.activities.npy"))
+        activities[:, cols["2"]] = 0
+        activities[0, cols["1"]] = 42  # Completed columns are not recalculated
+        np.save(os.path.join(dirpath, "method-0.activities.npy"), activities)
+
+        results = contribution_for_all_datasets_one_method(
+            "p", ("m",), checkpoint_dir=dirpath
+        )
+        assert np.allclose(
+            results["activities"][:, cols["2"]], expected["activities"][:, cols["2"]]
+        )
+        assert results["activities"][0, cols["1"]] == 42
+        del results
+
+        # Nothing left to calculate
+        results = contribution_for_all_datasets_one_method(
+            "p", ("m",), checkpoint_dir=dirpath, processes=2
+        )
+        assert results["activities"][0, cols["1"]] == 42
+        del results
+
+        bd.Method(("n",)).write([(("b", "flow"), 2)])
+        with pytest.raises(ValueError):
+            contribution_for_all_datasets_one_method(
+                "p", ("n",), checkpoint_dir=dirpath
+            )
+
+
+@bw2test
+def test_contribution_for_all_datasets_blocks():
+    sweep_fixture()
+    bd.Method(("n",)).write([(("b", "flow"), -5)])
+    for storage in ("dense", "sparse"):
+        expected = contribution_for_all_datasets_multiple_methods(
+            "p", [("m",), ("n",)], storage=storage, limit=1
+        )
+        results = contribution_for_all_datasets_multiple_methods(
+            "p", [("m",), ("n",)], storage=storage, limit=1, block_size=2
+        )
+        for method in expected:
+            for kind in ("activities", "flows", "all"):
+                if storage == "sparse":
+                    assert results[method][kind].nnz == expected[method][kind].nnz
+                    results[method][kind] = results[method][kind].toarray()
+                    expected[method][kind] = expected[method][kind].toarray()
+                assert np.allclose(results[method][kind], expected[method][kind])
+
+
+def test_tail_histogram():
+    values = np.array([[0.5, 0.3, 0.15, 0.05, 0], [1e-14, 0.5, 0.5, 0, 0]])
+    top = top_indices(values, 2)
+    counts = tail_histogram(values, top, 12)
+    assert counts.shape == (2, 12)
+    assert counts[0].sum() == 2 and counts[1].sum() == 1
+    assert counts[0, 10] == 1 and counts[0, 11] == 1
+    assert counts[1, 0] == 1
+    assert len(tail_bin_edges(12)) == 13
+
+
+@bw2test
+def test_contribution_for_all_datasets_all_limit():
+    cols = sweep_fixture()
+    for block_size in (None, 2):
+        results = contribution_for_all_datasets_one_method(
+            "p", ("m",), all_limit=1, tail_bins=4, block_size=block_size
+        )
+        assert results["all"].shape == (1, 3)
+        assert np.allclose(results["all"][0, cols["2"]], 2 / 3)
+        assert results["tail"].shape == (4, 3)
+        assert results["tail"][:, cols["2"]].sum() == 1
+        assert results["tail"][:, cols["1"]].sum() == 0
+        assert len(results["tail_edges"]) == 5
+
+
+@bw2test
+def test_contribution_for_all_datasets_callbacks():
+    sweep_fixture()
+    with tempfile.TemporaryDirectory() as dirpath:
+        filepath = os.path.join(dirpath, "metrics.json")
+        contribution_for_all_datasets_one_method(
+            "p", ("m",), progress=False, callbacks=[JSONMetricsSink(filepath)]
+        )
+        with open(filepath) as f:
+            metrics = json.load(f)
+    assert metrics["completed"] == metrics["total"] == 3
+    assert set(metrics["phases"]) == {"solve", "lcia", "extract", "store"}
+    assert metrics["peak_memory"] > 0
+
+
+def test_supply_chain_dependents():
+    # 0 uses 1, 1 uses 2, 3 is independent
+    matrix = sparse.csr_matrix(
+        np.array(
+            [
+                [1, 0, 0, 0],
+                [-1, 1, 0, 0],
+                [0, -1, 1, 0],
+                [0, 0, 0, 1],
+            ]
+        )
+    )
+    assert supply_chain_dependents(matrix, [2]).tolist() == [True, True, True, False]
+    assert supply_chain_dependents(matrix, [0]).tolist() == [True, False, False, False]
+    assert not supply_chain_dependents(matrix, []).any()
+
+
+def test_supply_chain_dependents_waste_treatment():
+    # 1 treats waste (negative reference product) produced by 0, and uses 2
+    matrix = sparse.csr_matrix(np.array([[1, 0, 0], [1, -1, 0], [0, -0.5, 1]]))
+    assert supply_chain_dependents(matrix, [1]).tolist() == [True, True, False]
+    assert supply_chain_dependents(matrix, [2]).tolist() == [True, True, True]
+    # Reference products can also be given explicitly, or partially (-1)
+    assert supply_chain_dependents(matrix, [2], products=[0, 1, 2]).all()
+    assert supply_chain_dependents(matrix, [1], products=[-1, 1, -1]).tolist() == [
+        True,
+        True,
+        False,
+    ]
+
+
+@bw2test
+def test_contribution_for_all_datasets_incremental():
+    cols = sweep_fixture()
+    for storage in ("dense", "sparse"):
+        previous = contribution_for_all_datasets_one_method(
+            "p", ("m",), storage=storage, progress=False
+        )
+        if storage == "dense":
+            # Not recalculated, so kept as is
+            previous["flows"][0, cols["3"]] = 42
+        with pytest.raises(ValueError):
+            contribution_for_all_datasets_one_method(
+                "p", ("m",), storage=storage, previous=previous
+            )
+
+        # Changes the contributions of both "1" and "2"
+        act = bd.get_activity(("p", "1"))
+        exc = next(iter(act.biosphere()))
+        exc["amount"] = 4 if exc["amount"] == 2 else 2
+        exc.save()
+
+        results = contribution_for_all_datasets_one_method(
+            "p",
+            ("m",),
+            storage=storage,
+            progress=False,
+            previous=previous,
+            changed=[("p", "1")],
+        )
+        expected = contribution_for_all_datasets_one_method(
+            "p", ("m",), storage=storage, progress=False
+        )
+        for kind in ("activities", "flows", "all"):
+            result, reference = results[kind], expected[kind]
+            if storage == "sparse":
+                result, reference = result.toarray(), reference.toarray()
+            if storage == "dense" and kind == "flows":
+                assert result[0, cols["3"]] == 42
+                result[0, cols["3"]] = 0
+            assert np.allclose(result, reference)
+
+
+def test_recursive_calculation_to_object_unit_scores(rcto_fixture):
+    expected = recursive_calculation_to_object(("f", "1"), ("m",), max_level=10)
+    results = recursive_calculation_to_object(
+        ("f", "1"), ("m",), max_level=10, use_unit_scores=True
+    )
+    assert len(results) == len(expected)
+    for result, reference in zip(results, expected):
+        assert result["label"] == reference["label"]
+        assert np.allclose(result["score"], reference["score"])
+        assert np.allclose(result["fraction"], reference["fraction"])
+        # Same record types in both modes
+        assert type(result["score"]) is type(reference["score"]) is float
+
+
+@bw2test
+def test_print_recursive_calculation_unit_scores():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    expected, result = io.StringIO(), io.StringIO()
+    print_recursive_calculation(
+        ("a", "1"), ("method",), max_level=5, cutoff=0, file_obj=expected
+    )
+    print_recursive_calculation(
+        ("a", "1"),
+        ("method",),
+        max_level=5,
+        cutoff=0,
+        file_obj=result,
+        use_unit_scores=True,
+    )
+    assert result.getvalue() == expected.getvalue()
+
+
+@bw2test
+def test_recursive_calculation_to_object_matrix_backend():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    expected = recursive_calculation_to_object(
+        ("a", "1"), ("method",), max_level=5, cutoff=0.001
+    )
+    for use_unit_scores in (False, True):
+        results = recursive_calculation_to_object(
+            ("a", "1"),
+            ("method",),
+            max_level=5,
+            cutoff=0.001,
+            backend="matrix",
+            use_unit_scores=use_unit_scores,
+        )
+        assert len(results) == len(expected)
+        for result, reference in zip(
+            sorted(results, key=lambda x: x["label"]),
+            sorted(expected, key=lambda x: x["label"]),
+        ):
+            assert result["label"] == reference["label"]
+            assert result["parent"] == reference["parent"]
+            assert result["key"] == reference["key"]
+            assert result["name"] == reference["name"]
+            assert np.allclose(result["score"], reference["score"])
+            assert np.allclose(result["amount"], reference["amount"])
+
+
+@bw2test
+def test_print_recursive_matrix_backend():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    for function, kwargs in (
+        (print_recursive_calculation, {"lcia_method": ("method",), "cutoff": 0}),
+        (print_recursive_supply_chain, {}),
+    ):
+        expected, result = io.StringIO(), io.StringIO()
+        function(("a", "1"), max_level=4, file_obj=expected, **kwargs)
+        function(("a", "1"), max_level=4, file_obj=result, backend="matrix", **kwargs)
+        assert sorted(result.getvalue().splitlines()) == sorted(
+            expected.getvalue().splitlines()
+        )
+
+    with pytest.raises(ValueError):
+        print_recursive_supply_chain(("a", "1"), backend="foo")
+
+
+@bw2test
+def test_recursive_calculation_to_object_max_nodes():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    everything = recursive_calculation_to_object(
+        ("a", "1"), ("method",), max_level=8, cutoff=0, backend="matrix"
+    )
+    results = recursive_calculation_to_object(
+        ("a", "1"),
+        ("method",),
+        max_level=8,
+        cutoff=0,
+        backend="matrix",
+        use_unit_scores=True,
+        max_nodes=4,
+    )
+    assert len(results) == 4
+    assert results[0]["label"] == "root"
+    labels = {x["label"] for x in results}
+    assert all(x["parent"] is None or x["parent"] in labels for x in results)
+    assert np.allclose(
+        sorted(abs(x["score"]) for x in results),
+        sorted(abs(x["score"]) for x in everything)[-4:],
+    )
+    with pytest.raises(ValueError):
+        recursive_calculation_to_object(("a", "1"), ("method",), max_nodes=4)
+
+
+@bw2test
+def test_recursive_calculation_to_object_max_nodes_deep_chain():
+    # Chain 0 -> 1 -> ... -> 5, each emitting one unit
+    data = {("d", "flow"): {"type": "emission", "exchanges": []}}
+    for i in range(6):
+        exchanges = [
+            {"input": ("d", str(i)), "amount": 1, "type": "production"},
+            {"input": ("d", "flow"), "amount": 1, "type": "biosphere"},
+        ]
+        if i < 5:
+            exchanges.append(
+                {"input": ("d", str(i + 1)), "amount": 1, "type": "technosphere"}
+            )
+        data[("d", str(i))] = {"name": str(i), "exchanges": exchanges}
+    bd.Database("d").write(data)
+    bd.Method(("m",)).write([(("d", "flow"), 1)])
+
+    # Without an explicit max_level, only the node budget limits the depth
+    results = recursive_calculation_to_object(
+        ("d", "0"), ("m",), cutoff=0, backend="matrix", max_nodes=100
+    )
+    assert [x["name"] for x in results] == ["0", "1", "2", "3", "4", "5"]
+    results = recursive_calculation_to_object(
+        ("d", "0"), ("m",), cutoff=0, backend="matrix", max_nodes=100, max_level=2
+    )
+    assert len(results) == 3
+    assert len(recursive_calculation_to_object(("d", "0"), ("m",), cutoff=0)) == 4
+
+
+@bw2test
+def test_with_metadata_yields_root_first():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    root = bd.get_activity(("a", "1"))
+    lca = bc.LCA({root: 1}, ("method",))
+    lca.lci()
+    index = TechnosphereIndex(lca)
+    taken = []
+
+    def nodes():
+        for node in depth_first(index, lca.dicts.activity[root.id], 1, 5):
+            taken.append(node)
+            yield node
+
+    records = _with_metadata(nodes(), index)
+    node, data = next(records)
+    assert len(taken) == 1 and node.level == 0
+    assert data["code"] == "1"
+    rest = list(records)
+    assert len(rest) + 1 == len(taken) > 1
+
+
+@bw2test
+def test_iter_recursive_calculation():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    records = iter_recursive_calculation(
+        ("a", "1"), ("method",), max_level=5, cutoff=0.001
+    )
+    first = next(records)
+    assert first["label"] == "root" and first["parent"] is None
+    assert first["level"] == 0 and first["fraction"] == 1
+    assert first["key"] == ("a", "1")
+    assert first["activity"] == str(bd.get_activity(("a", "1")))
+    second = next(records)
+    assert second["parent"] == "root" and second["level"] == 1
+    records.close()
+
+    expected = recursive_calculation_to_object(
+        ("a", "1"), ("method",), max_level=5, cutoff=0.001, backend="matrix"
+    )
+    buffer = io.StringIO()
+    df, _ = write_records(
+        iter_recursive_calculation(("a", "1"), ("method",), max_level=5, cutoff=0.001),
+        DataFrameSink(fields=["label", "parent", "score"]),
+        JSONLinesSink(buffer),
+    )
+    assert list(df.columns) == ["label", "parent", "score"]
+    assert df["label"].tolist() == [x["label"] for x in expected]
+    lines = [json.loads(line) for line in buffer.getvalue().splitlines()]
+    assert [x["label"] for x in lines] == [x["label"] for x in expected]
+
+    buffer = io.StringIO()
+    write_records(
+        iter_recursive_calculation(("a", "1"), ("method",), max_level=1),
+        CSVSink(buffer, fields=["label", "amount"]),
+    )
+    assert buffer.getvalue().splitlines()[:2] == ["label,amount", "root,1.0"]
+
+
+@bw2test
+def test_recursive_calculation_to_object_columnar():
+    bd.Database("a").write(recursive_fixture)
+    bd.Method(("method",)).write([(("a", "flow"), 1)])
+    expected = recursive_calculation_to_object(
+        ("a", "1"), ("method",), max_level=5, cutoff=0.001, backend="matrix"
+    )
+    tree = recursive_calculation_to_object(
+        ("a", "1"),
+        ("method",),
+        max_level=5,
+        cutoff=0.001,
+        backend="matrix",
+        columnar=True,
+    )
+    assert len(tree) == len(expected)
+    assert tree.parent.dtype == np.int64 and tree.parent[0] == -1
+    assert tree.activity.dtype == np.int32
+    assert tree.score.dtype == np.float64
+    assert np.allclose(tree.score, [x["score"] for x in expected])
+    assert np.allclose(tree.fraction, [x["fraction"] for x in expected])
+    assert tree.labels() == [x["label"] for x in expected]
+    assert tree.metadata("name") == [x["name"] for x in expected]
+    assert tree.children(0).tolist() == [1]
+
+    df = tree.as_dataframe()
+    reference = recursive_calculation_to_object(
+        ("a", "1"),
+        ("method",),
+        max_level=5,
+        cutoff=0.001,
+        backend="matrix",
+        as_dataframe=True,
+    )
+    assert df.columns.tolist() == reference.columns.tolist()
+    assert df["label"].tolist() == reference["label"].tolist()
+    assert df["parent"].tolist() == reference["parent"].tolist()
+    assert df["key"].tolist() == reference["key"].tolist()
+
+    with pytest.raises(ValueError):
+        recursive_calculation_to_object(("a", "1"), ("method",), columnar=True)